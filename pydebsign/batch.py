@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+pydebsign.batch
+---------------
+
+debsign process for many .changes files with a pool of worker threads.
+signing and verifying are mostly waiting for gpg, dput and disk I/O,
+so the threads run them concurrently.
+
+files referenced by some uploads of a batch, such as orig tarball of
+per-architecture uploads, are hashed once by :class:`HashCache`.
+in default, only the .dsc of each upload is hashed and it is not shared,
+so the cache saves hashing only with ``verify_artifacts=True``.
+
+----
+"""
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+from pydebsign.debsign import debsign_process
+from pydebsign.process import null_stage
+
+
+class HashCache(object):
+    """The :class:`HashCache <HashCache>` object,
+    checksums of files identified by device, inode, size and mtime."""
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        #: :data:`int`: number of hashed files
+        self.misses = 0
+        #: :data:`int`: number of checksums shared with another upload
+        self.hits = 0
+
+    @staticmethod
+    def file_key(file_path):
+        """
+        identifier of file content.
+
+        :rtype: tuple
+        :return: device, inode, size and mtime of file
+        :param str file_path: file path
+        """
+        stat = os.stat(file_path)
+        return (stat.st_dev, stat.st_ino, stat.st_size,
+                getattr(stat, 'st_mtime_ns', stat.st_mtime))
+
+    def get(self, file_path, function, args=(), stage=None):
+        """
+        get checksums of file, hash it when not hashed yet in the batch.
+        a file being hashed by another thread is waited for.
+
+        :return: return value of function
+        :param str file_path: file path
+        :param function function: function hashing file of file path
+        :param tuple args: other arguments of function (e.g. algorithms)
+        :param stage: context manager entered only while hashing,
+
+            (e.g. ``hash`` stage of :class:`StageRunner
+            <pydebsign.process.StageRunner>`), so the threads waiting
+            for a file being hashed do not hold a slot of CPU gate.
+        """
+        key = (self.file_key(file_path), function, args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+                self.misses += 1
+                owner = True
+            else:
+                self.hits += 1
+                owner = False
+        if owner:
+            try:
+                with stage or null_stage():
+                    entry.value = function(file_path, *args)
+            except Exception as exc:
+                entry.exception = exc
+                with self._lock:
+                    # hash again at next time
+                    del self._entries[key]
+                raise
+            finally:
+                entry.done.set()
+        else:
+            entry.done.wait()
+            if entry.exception is not None:
+                raise entry.exception
+        return entry.value
+
+
+class _Entry(object):  # pylint: disable=too-few-public-methods
+    """checksums of a file being hashed or hashed."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.exception = None
+
+
+def debsign_batch(changes_paths, processes=None, hash_cache=None, **kwargs):
+    """
+    debsign process for many .changes files.
+
+    :rtype: list
+    :return: list of tuple of .changes file path, result and errors,
+             result is ``True``, ``False`` or raised exception,
+             errors is list of :class:`StageError
+             <pydebsign.process.StageError>` of timeouts and retries.
+
+    :param list changes_paths: .changes file paths
+    :param int processes: number of worker threads,
+
+        the number of CPUs is used when this is None.
+
+    :param hash_cache: :class:`HashCache` shared by the uploads,
+
+        new one is created when this is None. files shared by uploads
+        are hashed only with ``verify_artifacts=True``.
+
+    :param kwargs: keyword arguments of
+
+        :func:`debsign_process() <pydebsign.debsign.debsign_process>`
+        (e.g. ``resign=True`` for rotating key).
+    """
+    if hash_cache is None:
+        hash_cache = HashCache()
+    kwargs['hash_cache'] = hash_cache
+    pool = ThreadPool(processes)
+    try:
+        return pool.map(lambda path: _process(path, kwargs), changes_paths)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _process(changes_path, kwargs):
+    """debsign process of a .changes, return raised exception as result."""
+    errors = []
+    try:
+        result = debsign_process(changes_path, errors=errors, **kwargs)
+    except Exception as exc:  # pylint: disable=broad-except
+        result = exc
+    return changes_path, result, errors
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+pydebsign.changes
+-----------------
+
+checksum fields of .changes; rewriting size and checksums of .dsc
+in parsed .changes, or patching the bytes of .changes including adding
+and dropping checksum fields.
+
+----
+"""
+import re
+
+
+#: checksum fields of .changes; field name, key of digest, algorithm
+#: of :mod:`hashlib` and number of columns of each line.
+CHECKSUM_FIELDS = (('Files', 'md5sum', 'md5', 5),
+                   ('Checksums-Sha1', 'sha1', 'sha1', 3),
+                   ('Checksums-Sha256', 'sha256', 'sha256', 3),
+                   ('Checksums-Sha512', 'sha512', 'sha512', 3))
+
+#: checksum fields used when .changes is not parsed yet.
+DEFAULT_CHECKSUM_FIELDS = CHECKSUM_FIELDS[:3]
+
+
+def rewrite_data(changes_obj, hash_type, filesize, hashdigest):
+    """rewrite .changes object with new file size and hashdigest.
+
+    :param `Deb822Dict` changes_obj: :class:`Deb822Dict` object
+    :param tuple hash_type: hash type of .changes
+    :param int filesize: expecting .dsc file size
+    :param str hashdigest: expecting .dsc hash digest
+    """
+    pattern = re.compile(r'.dsc\Z')
+    line = [line for line in changes_obj[hash_type[0]]
+            if pattern.search(line.get('name'))][0]
+    line_index = changes_obj[hash_type[0]].index(line)
+    changes_obj[hash_type[0]][line_index]['size'] = str(filesize)
+    changes_obj[hash_type[0]][line_index][hash_type[1]] = hashdigest
+
+
+def patch_changes(data, filesize, checksums,
+                  checksum_fields=DEFAULT_CHECKSUM_FIELDS, added=None):
+    """patch size and hashdigest of .dsc in checksum lines of .changes.
+
+    only the size and digest columns of the .dsc lines are spliced
+    by byte offsets, checksum fields not in checksum_fields are cut
+    and added checksum fields are inserted before ``Files``. the other
+    bytes of .changes are kept as is.
+
+    :rtype: bytes
+    :return: patched .changes data, ``None`` is unexpected layout.
+
+    :param bytes data: unsigned .changes data
+    :param int filesize: expecting .dsc file size
+    :param tuple checksums: hexdigests ordered as checksum_fields
+    :param tuple checksum_fields: checksum fields of :data:`CHECKSUM_FIELDS`
+    :param dict added: lines of checksum fields to add,
+
+        as return of :meth:`Debsign.added_checksums()
+        <pydebsign.debsign.Debsign.added_checksums>`.
+    """
+    if data.startswith(b'-----BEGIN PGP SIGNED MESSAGE-----'):
+        return None
+    added = added or {}
+    size = str(filesize).encode('ascii')
+    splices = []
+    for (field, key, _, columns), digest in zip(checksum_fields, checksums):
+        if field in added:
+            span = _field_span(data, 'Files')
+            if span is None:
+                return None
+            splices.append((span[0], span[0], field.encode('ascii') +
+                            b':\n' + b''.join(
+                                _checksum_line(line, key)
+                                for line in added[field])))
+            continue
+        line = _dsc_line(data, field, columns)
+        if line is None:
+            return None
+        splices.append((line.start(2), line.end(4),
+                        digest.encode('ascii') + line.group(3) + size))
+    for checksum_field in CHECKSUM_FIELDS:
+        if checksum_field in checksum_fields:
+            continue
+        span = _field_span(data, checksum_field[0])
+        if span is not None:
+            splices.append((span[0], span[2], b''))
+    for start, end, value in sorted(splices, reverse=True):
+        data = data[:start] + value + data[end:]
+    return data
+
+
+def _checksum_line(line, key):
+    """line of checksum field with digest of key, size and name."""
+    return b''.join(b' ' + line[name].encode('ascii')
+                    for name in (key, 'size', 'name')) + b'\n'
+
+
+def _field_span(data, field):
+    """offsets of field in .changes data; start and end of the header
+    line, and end of the continuation lines. ``None`` is missing."""
+    header = re.compile(br'^' + re.escape(field.encode('ascii')) +
+                        br':[ \t]*\r?\n', re.M).search(data)
+    if header is None:
+        return None
+    offset = header.end()
+    while offset < len(data) and data[offset:offset + 1] in b' \t':
+        end = data.find(b'\n', offset)
+        offset = len(data) if end == -1 else end + 1
+    return header.start(), header.end(), offset
+
+
+def _dsc_line(data, field, columns):
+    """match of the .dsc line of checksum field in .changes data,
+    groups 2 and 4 are digest and size. ``None`` is unexpected layout."""
+    span = _field_span(data, field)
+    if span is None:
+        return None
+    line_pattern = re.compile(br'([ \t]+)(\S+)([ \t]+)(\S+)([ \t].*)\Z')
+    matches = []
+    offset = span[1]
+    while offset < span[2]:
+        end = data.find(b'\n', offset, span[2])
+        if end == -1:
+            end = span[2]
+        line = line_pattern.match(data, offset, end)
+        if line is None or len(data[offset:end].split()) != columns:
+            return None
+        if line.group(5).split()[-1].endswith(b'.dsc'):
+            matches.append(line)
+        offset = end + 1
+    if len(matches) != 1:
+        return None
+    return matches[0]
@@ -6,8 +6,10 @@ pydebsign.debsign
 debsign process as follows;
 
 1. Signing .dsc file with GPG key.
-2. Retrieve size and md5, sha1, sha256 checksums from signed .dsc.
-3. Rewrite of above values at .changes.
+2. Retrieve size and checksums of the checksum fields of .changes
+   (or of ``digests``) from signed .dsc.
+3. Rewrite of above values at .changes, adding or dropping checksum
+   fields for ``digests``.
 4. Siging .changes file with GPG key.
 
 optional:
@@ -17,21 +19,46 @@ How to verify signed files ``dput -o .changes`` command.
 """
 import re
 import os.path
-import hashlib
-import subprocess
-import codecs
+import threading
 import shlex
-import gnupg
-import deb822
-from pguard import guard
-from pguard import guard_cl as g
+from pydebsign.changes import (CHECKSUM_FIELDS, DEFAULT_CHECKSUM_FIELDS,
+                               patch_changes, rewrite_data)
+from pydebsign.files import link_file, strip_file, write_atomic
+from pydebsign.process import (DPUT_COMMAND, StageRunner, StageTimeout,
+                               check_dput_host, timer, watched_gpg)
+
+# gnupg, deb822, hashlib and subprocess are imported
+# at first use to keep cold start of short-lived invocations fast.
+
+
+#: names and failure messages of verification checks.
+VERIFICATION_CHECKS = (('filesize', 'difference file size of .dsc'),
+                       ('checksums', 'invalid checksums of .dsc'),
+                       ('dsc_signature', 'invalid signature of .dsc'),
+                       ('changes_signature', 'invalid signature of .changes'),
+                       ('dput', 'invalid checking with dput'),
+                       ('artifacts', 'invalid checksums of files'))
+
+#: stages of debsign process passed to ``stage_hook`` of Debsign;
+#: ``hash`` and ``dput`` (including lintian) are CPU-bound,
+#: ``sign`` and ``verify`` are bound to gpg-agent.
+STAGES = ('hash', 'sign', 'verify', 'dput')
+
+#: size of chunks reading files to hash
+CHUNK_SIZE = 1024 * 1024
 
 
 class Debsign(object):
     """The :class:`Debsign <Debsign>` object."""
+    # pylint: disable=too-many-instance-attributes,too-many-public-methods
     def __init__(self, changes_path, passphrase=None, keyid=None,
                  gnupghome=None, verbose=False,
-                 lintian=True, dput_host='local'):
+                 lintian=True, dput_host='local', fast_rewrite=False,
+                 stage_hook=None, timeouts=None, retries=2, backoff=1.0,
+                 hash_cache=None, verify_artifacts=False, digests=None,
+                 output_dir=None, dput_command=DPUT_COMMAND,
+                 resign_gnupghome=None):
+        # pylint: disable=too-many-locals
         #: changes file path: .changes file path
         self.changes_path = os.path.abspath(changes_path)
 
@@ -52,31 +79,132 @@ class Debsign(object):
 
         if gnupghome:
             os.environ['GNUPGHOME'] = os.path.abspath(gnupghome)
-            self.gpg = gnupg.GPG(gnupghome=gnupghome,
-                                 use_agent=use_agent,
-                                 verbose=verbose)
+            self._gpg_options = dict(gnupghome=gnupghome,
+                                     use_agent=use_agent,
+                                     verbose=verbose)
         else:
-            self.gpg = gnupg.GPG(use_agent=use_agent, verbose=verbose)
+            self._gpg_options = dict(use_agent=use_agent, verbose=verbose)
+        self._gpg = None
         #: lintian mode (default: ``True``);
         #: True is running lintian by dput
         self.lintian = lintian
-        if check_dput_host(dput_host) is False:
-            raise KeyError('%s is not defined '
-                           'in /etc/dput.cf or ~/.dput.cf' % dput_host)
         #: :data:`str`: specify host identifier for dput
         #: ``local`` is defined in ``/etc/dput.cf`` in default;
         #: cf. you know to print ``dput -H``.
+        #: this is checked by check_dput_host() before signing.
         self.dput_host = dput_host
+        #: :data:`str`: dput command (default: :data:`DPUT_COMMAND`)
+        self.dput_command = dput_command
+        #: fast rewrite mode (default: ``False``);
+        #: True is patching only checksum lines of .dsc in .changes
+        #: instead of round-trip with :class:`deb822.Changes`.
+        self.fast_rewrite = fast_rewrite
+        #: :class:`StageRunner <pydebsign.process.StageRunner>` running
+        #: stages of :data:`STAGES` with ``stage_hook``, ``timeouts``,
+        #: and ``retries`` of gpg with ``backoff``.
+        self.runner = StageRunner(stage_hook, timeouts, retries, backoff)
+        #: :class:`HashCache <pydebsign.batch.HashCache>` shared by
+        #: uploads of a batch, files are hashed once per batch.
+        #: only .dsc is hashed unless ``verify_artifacts`` is ``True``.
+        self.hash_cache = hash_cache
+        #: verify checksums of all files of .changes (default: ``False``)
+        self.verify_artifacts = verify_artifacts
+        #: :data:`tuple`: algorithms of digests (e.g. ``('sha256',
+        #: 'sha512')``) of optional checksum fields written to .changes,
+        #: other checksum fields are dropped. md5 of ``Files`` is always
+        #: written. the checksum fields of .changes are kept when this
+        #: is None.
+        self.digests = digests
+        #: checksum fields of :data:`CHECKSUM_FIELDS` used,
+        #: set by parse_changes().
+        self.checksum_fields = DEFAULT_CHECKSUM_FIELDS
+        #: :data:`str`: directory to write signed .changes and .dsc,
+        #: other files are hardlinked, reflinked or copied there.
+        #: source directory is not modified. .changes and .dsc are
+        #: signed in place when this is None.
+        self.output_dir = output_dir and os.path.abspath(output_dir)
+        #: :data:`dict`: file names staged to ``output_dir`` and how,
+        #: ``copy``, ``hardlink`` or ``reflink``.
+        self.staged = {}
+        #: :data:`str`: GnuPG home directory with public keys of existing
+        #: signatures verified before stripping them (e.g. old keys of
+        #: key rotation), ``gnupghome`` is used when this is None.
+        self.resign_gnupghome = resign_gnupghome
+        self._resign_gpg = None
+
+    @property
+    def gpg(self):
+        """:class:`gnupg.GPG` object, created at first use.
+        gpg processes are watched by ``runner`` for timeouts."""
+        if self._gpg is None:
+            self._gpg = watched_gpg(self.runner.watch, **self._gpg_options)
+        return self._gpg
+
+    @property
+    def resign_gpg(self):
+        """:class:`gnupg.GPG` object verifying existing signatures
+        before stripping them, with keys of ``resign_gnupghome``."""
+        if self.resign_gnupghome is None:
+            return self.gpg
+        if self._resign_gpg is None:
+            options = dict(self._gpg_options,
+                           gnupghome=self.resign_gnupghome)
+            self._resign_gpg = watched_gpg(self.runner.watch, **options)
+        return self._resign_gpg
+
+    def check_dput_host(self):
+        """
+        check dput host is defined in dput.cf.
+
+        :raises KeyError: dput host is not defined.
+        :raises StageTimeout: ``dput -H`` is timed out.
+        """
+        try:
+            defined = check_dput_host(self.dput_host,
+                                      self.runner.timeouts.get('dput'),
+                                      self.dput_command)
+        except StageTimeout as error:
+            self.runner.errors.append(error)
+            raise
+        if defined is False:
+            raise KeyError('%s is not defined '
+                           'in /etc/dput.cf or ~/.dput.cf' % self.dput_host)
 
     def initialize(self):
         """
-        initialize common propeties
+        initialize common propeties,
+        stage files to ``output_dir`` when it is specified.
         """
+        if (self.output_dir is not None and
+                os.path.dirname(self.changes_path) != self.output_dir):
+            self.stage_output()
         base_path = os.path.dirname(os.path.abspath(self.changes_path))
         file_list = self.parse_changes()
         self.dsc_path = os.path.join(base_path,
                                      self.retrieve_dsc_path(file_list[0]))
 
+    def stage_output(self):
+        """
+        copy .changes and .dsc to ``output_dir``, and link other files
+        of .changes there, then .changes path points to the copy.
+        """
+        source_dir = os.path.dirname(self.changes_path)
+        file_list = self.parse_changes()
+        dsc_name = self.retrieve_dsc_path(file_list[0])
+        try:
+            os.makedirs(self.output_dir)
+        except OSError:
+            if not os.path.isdir(self.output_dir):
+                raise
+        names = [_file.get('name') for _file in file_list[0]]
+        names.append(os.path.basename(self.changes_path))
+        for name in names:
+            self.staged[name] = link_file(
+                os.path.join(source_dir, name),
+                os.path.join(self.output_dir, name),
+                name in (dsc_name, names[-1]))
+        self.changes_path = os.path.join(self.output_dir, names[-1])
+
     def is_signed(self, file_path):
         """
         checking signed file with GPG key
@@ -86,35 +214,95 @@ class Debsign(object):
         :param str file_path: expecting .dsc file or .changes file.
         """
         with open(file_path, 'rb') as fileobj:
-            data = fileobj.read()
-            if check_encode(data):
-                # for Python 3
-                data = data.decode('utf-8')
-
-            if data.find('-----BEGIN PGP SIGNED MESSAGE-----') == 0:
-                # signed data why found gpg header
-                if self.gpg.verify(data).timestamp is None:
-                    # invalid signed data
-                    raise ValueError('invalid signed data')
-                else:
-                    # valid signed data
-                    return True
-            else:
-                # not signed data
-                return False
+            signed = fileobj.readline().startswith(
+                b'-----BEGIN PGP SIGNED MESSAGE-----')
+        if not signed:
+            # not signed data
+            return False
+        # signed data why found gpg header
+        if self.verify_file(file_path).timestamp is None:
+            # invalid signed data
+            raise ValueError('invalid signed data')
+        return True
+
+    def strip_signature(self, file_path):
+        """
+        strip clearsign wrapper of signed file in place,
+        after verifying the signature.
+        the file is read line by line and replaced atomically.
+
+        :rtype: bool
+        :return: ``True`` is stripped, ``False`` is unsigned file.
+        :raises ValueError: invalid signature, the file is not modified.
+        :param str file_path: expecting .dsc file or .changes file.
+        """
+        return self.strip_signatures([file_path])[0]
+
+    def strip_signatures(self, file_paths=None):
+        """
+        strip signatures for re-signing. all signatures are verified
+        with ``resign_gpg`` before any file is modified, so tampered
+        files are never signed again with the key. good signatures
+        made by expired keys are stripped, signatures of revoked keys
+        and unknown keys are not.
+
+        :rtype: list
+        :return: ``True`` is stripped, ``False`` is unsigned file.
+        :raises ValueError: invalid signature, no file is modified.
+        :param list file_paths: .dsc and .changes in default.
+        """
+        if file_paths is None:
+            file_paths = [self.dsc_path, self.changes_path]
+        for file_path in file_paths:
+            with open(file_path, 'rb') as fileobj:
+                signed = fileobj.readline().startswith(
+                    b'-----BEGIN PGP SIGNED MESSAGE-----')
+            if not signed:
+                continue
+            result = self.verify_file(file_path, self.resign_gpg)
+            if not is_strippable(result):
+                raise ValueError('invalid signature of %s: %s' %
+                                 (os.path.basename(file_path),
+                                  getattr(result, 'status', None)))
+        return [strip_file(file_path) for file_path in file_paths]
 
     def parse_changes(self):
         """
         parse .changes and retrieve efile size and file name list.
+        ``checksum_fields`` are the checksum fields of ``digests``
+        to be written by rewrite_changes(), or the checksum fields
+        in .changes when ``digests`` is None or .changes is signed.
 
         :rtype: list
-        :return: file list with file size and checksums.
+        :return: file list with file size and checksums,
+
+            ordered as ``checksum_fields``, empty for a checksum field
+            not in .changes yet.
+        :raises ValueError: ``Files`` is missing, or unknown ``digests``.
         """
+        import deb822
         with open(self.changes_path, 'rb') as fileobj:
+            signed = fileobj.readline().startswith(
+                b'-----BEGIN PGP SIGNED MESSAGE-----')
+            fileobj.seek(0)
             changes = deb822.Changes(fileobj)
-        return [changes['Files'],
-                changes['Checksums-Sha1'],
-                changes['Checksums-Sha256']]
+        if not isinstance(changes.get('Files'), list):
+            raise ValueError('no Files field in .changes')
+        if self.digests is None or signed:
+            self.checksum_fields = tuple(
+                checksum_field for checksum_field in CHECKSUM_FIELDS
+                if isinstance(changes.get(checksum_field[0]), list))
+        else:
+            unknown = set(self.digests).difference(
+                checksum_field[2] for checksum_field in CHECKSUM_FIELDS)
+            if unknown:
+                raise ValueError('unknown digests: %s'
+                                 % ', '.join(sorted(unknown)))
+            self.checksum_fields = CHECKSUM_FIELDS[:1] + tuple(
+                checksum_field for checksum_field in CHECKSUM_FIELDS[1:]
+                if checksum_field[2] in self.digests)
+        return [changes.get(checksum_field[0], [])
+                for checksum_field in self.checksum_fields]
 
     @staticmethod
     def retrieve_dsc_path(file_list):
@@ -139,16 +327,13 @@ class Debsign(object):
         """
         with open(self.changes_path, 'rb') as fileobj:
             data = fileobj.read()
-        signed_data = self.gpg.sign(data, passphrase=self.passphrase,
-                                    keyid=self.keyid)
+        signed_data = self.runner.run_gpg('sign', self.gpg.sign, data,
+                                          passphrase=self.passphrase,
+                                          keyid=self.keyid)
         if signed_data.fingerprint is None and signed_data.type is None:
             return False
 
-        with open(self.changes_path, 'w') as fileobj:
-            if check_encode(signed_data.data):
-                fileobj.write(signed_data.data.decode('utf-8'))
-            else:
-                fileobj.write(signed_data.data)
+        write_atomic(self.changes_path, signed_data.data)
         return True
 
     def signing_dsc(self):
@@ -161,61 +346,132 @@ class Debsign(object):
         """
         with open(self.dsc_path, 'rb') as fileobj:
             data = fileobj.read()
-        signed_data = self.gpg.sign(data, passphrase=self.passphrase,
-                                    keyid=self.keyid)
+        signed_data = self.runner.run_gpg('sign', self.gpg.sign, data,
+                                          passphrase=self.passphrase,
+                                          keyid=self.keyid)
         if signed_data.fingerprint is None and signed_data.type is None:
             return False
 
-        with open(self.dsc_path, 'w') as fileobj:
-            if check_encode(signed_data.data):
-                fileobj.write(signed_data.data.decode('utf-8'))
-            else:
-                fileobj.write(signed_data.data)
+        write_atomic(self.dsc_path, signed_data.data)
         return True
 
-    def rewrite_changes(self, filesize, checksums):
+    def rewrite_changes(self, filesize, checksums, file_list=None):
         """
-        rewrite file size and hash fingerprint of .dsc file.
+        rewrite file size and hash fingerprint of .dsc file,
+        add checksum fields of ``checksum_fields`` not in .changes,
+        and drop the other checksum fields.
         invoke retrieve_checksums() and retreive_filesize().
         this method is invoked by siging_dsc().
 
         :rtype: bool
         :return: status code
         :param int filesize: .dsc file size
-        :param tuple checksums: md5sum, sha1, sha256 hexdigest
+        :param tuple checksums: hexdigests ordered as ``checksum_fields``
+        :param list file_list: file list as return of parse_changes(),
+
+            .changes is parsed when this is None.
         """
+        if file_list is None:
+            file_list = self.parse_changes()
+        added = self.added_checksums(file_list, filesize, checksums)
+        if self.fast_rewrite:
+            with open(self.changes_path, 'rb') as fileobj:
+                data = patch_changes(fileobj.read(), filesize, checksums,
+                                     self.checksum_fields, added)
+            if data is not None:
+                write_atomic(self.changes_path, data)
+                return True
+            # unexpected layout, fall back to deb822 round-trip.
+        import deb822
         with open(self.changes_path, 'rb') as fileobj:
             changes = deb822.Changes(fileobj)
-        # md5sum
-        rewrite_data(changes, ('Files', 'md5sum'), filesize, checksums[0])
-        # sha1
-        rewrite_data(changes, ('Checksums-Sha1', 'sha1'),
-                     filesize, checksums[1])
-        # sha1
-        rewrite_data(changes, ('Checksums-Sha256', 'sha256'),
-                     filesize, checksums[2])
-        with codecs.open(self.changes_path, 'w', 'utf-8') as fileobj:
-            if check_encode(changes.dump()):
-                fileobj.write(changes.dump().decode('utf-8'))
+        for checksum_field in CHECKSUM_FIELDS:
+            if (checksum_field not in self.checksum_fields and
+                    checksum_field[0] in changes):
+                del changes[checksum_field[0]]
+        for (field, key, _, _), digest in zip(self.checksum_fields,
+                                              checksums):
+            if field in added:
+                changes[field] = added[field]
             else:
-                fileobj.write(changes.dump())
+                rewrite_data(changes, (field, key), filesize, digest)
+        write_atomic(self.changes_path, changes.dump())
         return True
 
+    def added_checksums(self, file_list, filesize, checksums):
+        """
+        lines of checksum fields of ``checksum_fields`` not in .changes,
+        files other than .dsc are hashed through ``hash_cache``.
+
+        :rtype: dict
+        :return: field name and its lines as parse_changes() returns
+        :param list file_list: file list as return of parse_changes().
+        :param int filesize: .dsc file size
+        :param tuple checksums: hexdigests ordered as ``checksum_fields``
+        """
+        indexes = [index for index, files in enumerate(file_list)
+                   if not files]
+        added = dict((self.checksum_fields[index][0], [])
+                     for index in indexes)
+        base_path = os.path.dirname(self.changes_path)
+        for _file in file_list[0] if indexes else ():
+            name = _file.get('name')
+            if name.endswith('.dsc'):
+                size, digests = str(filesize), checksums
+            else:
+                size = _file.get('size')
+                digests = self.checksums(os.path.join(base_path, name))
+            for index in indexes:
+                field, key = self.checksum_fields[index][:2]
+                added[field].append({key: digests[index], 'size': size,
+                                     'name': name})
+        return added
+
+    def checksums(self, file_path):
+        """
+        retrieve checksums of ``checksum_fields`` through ``hash_cache``
+        in the ``hash`` stage. the stage is entered only by the thread
+        hashing the file, not by threads waiting for it.
+
+        :rtype: tuple
+        :return: hexdigests ordered as ``checksum_fields``.
+
+        :param str file_path: file path
+        """
+        algorithms = tuple(checksum_field[2]
+                           for checksum_field in self.checksum_fields)
+        if self.hash_cache is None:
+            with self.runner.stage('hash'):
+                return self.retrieve_checksums(file_path, algorithms)
+        return self.hash_cache.get(file_path, self.retrieve_checksums,
+                                   (algorithms,), self.runner.stage('hash'))
+
     @staticmethod
-    def retrieve_checksums(file_path):
+    def retrieve_checksums(file_path, algorithms=('md5', 'sha1', 'sha256')):
         """
-        retrieve md5, sha1, sha256 checksums.
+        retrieve checksums, the file is read once for all algorithms.
 
         :rtype: tuple
-        :return: md5, sha1, sha256 hexdigest.
+        :return: hexdigests ordered as algorithms.
 
         :param str file_path: expecting .dsc file path.
+        :param tuple algorithms: algorithms of :mod:`hashlib`
         """
+        import hashlib
         with open(file_path, 'rb') as fileobj:
-            data = fileobj.read()
-        return (hashlib.md5(data).hexdigest(),
-                hashlib.sha1(data).hexdigest(),
-                hashlib.sha256(data).hexdigest())
+            if len(algorithms) == 1 and hasattr(hashlib, 'file_digest'):
+                return (hashlib.file_digest(fileobj,
+                                            algorithms[0]).hexdigest(),)
+            hashes = [hashlib.new(algorithm) for algorithm in algorithms]
+            buf = bytearray(CHUNK_SIZE)
+            view = memoryview(buf)
+            while True:
+                size = fileobj.readinto(buf)
+                if not size:
+                    break
+                for _hash in hashes:
+                    _hash.update(view[:size])
+        return tuple(_hash.hexdigest() for _hash in hashes)
 
     @staticmethod
     def retrieve_filesize(file_path):
@@ -246,30 +502,51 @@ class Debsign(object):
                                 if pattern.search(_file.get('name'))][0]
 
     @staticmethod
-    def verify_checksums(dsc_checksums, file_list):
+    def verify_checksums(dsc_checksums, file_list,
+                         checksum_fields=DEFAULT_CHECKSUM_FIELDS):
         """
         verify checksums (and size) with file list retrieved from changes.
 
         :rtype: bool
         :return: ``True`` is valid, ``False`` is invalid.
 
+        :param tuple dsc_checksums: hexdigests ordered as checksum_fields
         :param list file_list: file list as return of parse_changes().
+        :param tuple checksum_fields: checksum fields of file_list
         """
         pattern = re.compile(r'.dsc\Z')
-        return guard(
-            g(False,
-              dsc_checksums[0] != [_file.get('md5sum')
-                                   for _file in file_list[0]
-                                   if pattern.search(_file.get('name'))][0]),
-            g(False,
-              dsc_checksums[1] != [_file.get('sha1')
-                                   for _file in file_list[1]
-                                   if pattern.search(_file.get('name'))][0]),
-            g(False,
-              dsc_checksums[2] != [_file.get('sha256')
-                                   for _file in file_list[2]
-                                   if pattern.search(_file.get('name'))][0]),
-            g(True))
+        return all(
+            digest == [_file.get(checksum_field[1]) for _file in files
+                       if pattern.search(_file.get('name'))][0]
+            for checksum_field, files, digest in zip(checksum_fields,
+                                                     file_list,
+                                                     dsc_checksums))
+
+    def verify_artifact_checksums(self, file_list):
+        """
+        verify size and checksums of all files of .changes.
+        each file is hashed in the ``hash`` stage, so large tarballs
+        are limited by the CPU gate of :mod:`pydebsign.scheduler`.
+
+        :rtype: bool
+        :return: ``True`` is valid, ``False`` is invalid.
+
+        :param list file_list: file list as return of parse_changes().
+        """
+        base_path = os.path.dirname(self.changes_path)
+        digests = [dict((_file.get('name'), _file.get(checksum_field[1]))
+                        for _file in files)
+                   for checksum_field, files in zip(self.checksum_fields,
+                                                    file_list)]
+        for _file in file_list[0]:
+            name = _file.get('name')
+            file_path = os.path.join(base_path, name)
+            if self.retrieve_filesize(file_path) != int(_file.get('size')):
+                return False
+            checksums = self.checksums(file_path)
+            if checksums != tuple(digest.get(name) for digest in digests):
+                return False
+        return True
 
     def verify_signature(self, file_path):
         """verify signature of file with GPG key.
@@ -279,8 +556,24 @@ class Debsign(object):
 
         :param str file_path: expecting .dsc file path or .changes file path
         """
-        with open(file_path) as fileobj:
-            return self.gpg.verify(fileobj.read()).valid
+        return self.verify_file(file_path).valid
+
+    def verify_file(self, file_path, gpg=None):
+        """verify signature of file streamed to gpg.
+
+        :rtype: :class:`gnupg.Verify`
+        :return: result of verification
+
+        :param str file_path: expecting .dsc file path or .changes file path
+        :param gpg: :class:`gnupg.GPG` object, ``gpg`` in default
+        """
+        gpg = gpg or self.gpg
+
+        def verify():
+            """open file for each attempt of retries."""
+            with open(file_path, 'rb') as fileobj:
+                return gpg.verify_file(fileobj)
+        return self.runner.run_gpg('verify', verify)
 
     def verify_with_dput(self):
         """verify .changes and .dsc files with ``dput`` command,
@@ -290,15 +583,74 @@ class Debsign(object):
         :return: ``True`` is valid, ``False`` is invalid.
         """
         if self.lintian:
-            command = '/usr/bin/dput -ol %s %s' % (self.dput_host,
-                                                   self.changes_path)
+            command = '%s -ol %s %s' % (self.dput_command, self.dput_host,
+                                        self.changes_path)
         else:
-            command = '/usr/bin/dput -o %s %s' % (self.dput_host,
-                                                  self.changes_path)
+            command = '%s -o %s %s' % (self.dput_command, self.dput_host,
+                                       self.changes_path)
         args = shlex.split(command)
-        return subprocess.call(args)
+        with self.runner.stage('dput'):
+            return self.runner.run_command('dput', args)[0]
+
+    def default_checks(self):
+        """
+        names of verification checks run in default.
+
+        :rtype: list
+        :return: names of :data:`VERIFICATION_CHECKS`, except ``artifacts``
+
+            unless ``verify_artifacts`` is ``True``.
+        """
+        return [name for name, _ in VERIFICATION_CHECKS
+                if name != 'artifacts' or self.verify_artifacts]
+
+    def verify(self, dsc_filesize, dsc_checksums, file_list, checks=None):
+        """
+        run verification checks of signed files concurrently.
+
+        :rtype: :class:`VerificationReport <VerificationReport>`
+        :return: report of all checks.
+
+        :param int dsc_filesize: file size retreived from .changes
+        :param tuple dsc_checksums: .dsc checksums retrieved from .changes
+        :param list file_list: file list retrieve .changes
+        :param list checks: names of :data:`VERIFICATION_CHECKS` to run,
 
-    def verification(self, dsc_filesize, dsc_checksums, file_list):
+            all checks are run when this is None, except ``artifacts``
+            unless ``verify_artifacts`` is ``True``.
+        :raises KeyError: dput host is not defined.
+        """
+        if checks is None:
+            checks = self.default_checks()
+        if 'dput' in checks:
+            self.check_dput_host()
+        functions = {
+            'filesize': lambda: self.verify_filesize(dsc_filesize,
+                                                     file_list),
+            'checksums': lambda: self.verify_checksums(
+                dsc_checksums, file_list, self.checksum_fields),
+            'dsc_signature': lambda: self.verify_signature(self.dsc_path),
+            'changes_signature': lambda: self.verify_signature(
+                self.changes_path),
+            'dput': lambda: self.verify_with_dput() == 0,
+            'artifacts': lambda: self.verify_artifact_checksums(file_list)}
+        results = [None] * len(VERIFICATION_CHECKS)
+        threads = []
+        for index, (name, message) in enumerate(VERIFICATION_CHECKS):
+            if name not in checks:
+                continue
+            thread = threading.Thread(target=run_check,
+                                      args=(results, index, name, message,
+                                            functions[name]))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return VerificationReport([result for result in results
+                                   if result is not None])
+
+    def verification(self, dsc_filesize, dsc_checksums, file_list,
+                     checks=None):
         """
         verification of signed files.
 
@@ -308,28 +660,94 @@ class Debsign(object):
         :param int dsc_filesize: file size retreived from .changes
         :param tuple dsc_checksums: .dsc checksums retrieved from .changes
         :param list file_list: file list retrieve .changes
+        :param list checks: names of :data:`VERIFICATION_CHECKS` to run
+                            as verify().
+        :raises ValueError: message of the first failed check.
+        :raises: exception raised in a check (e.g. OSError of dput,
+                 :class:`StageTimeout`), prior to failed checks.
         """
-        result = guard(
-            g(ValueError('difference file size of .dsc'),
-              self.verify_filesize(dsc_filesize, file_list) is False),
-            g(ValueError('invalid checksums of .dsc'),
-              self.verify_checksums(dsc_checksums, file_list) is False),
-            g(ValueError('invalid signature of .dsc'),
-              self.verify_signature(self.dsc_path) is False),
-            g(ValueError('invalid signature of .changes'),
-              self.verify_signature(self.changes_path) is False),
-            g(ValueError('invalid checking with dput'),
-              self.verify_with_dput() != 0),
-            g(True))
-        if result is not True:
-            raise result
-        return result
+        report = self.verify(dsc_filesize, dsc_checksums, file_list, checks)
+        for result in report.failures:
+            if result.exception is not None:
+                raise result.exception
+        if report.passed is False:
+            raise ValueError(report.failures[0].message)
+        return True
+
+
+class CheckResult(object):  # pylint: disable=too-few-public-methods
+    """The :class:`CheckResult <CheckResult>` object,
+    result of a verification check."""
+    def __init__(self, name, passed, message, duration, exception=None):
+        #: :data:`str`: name of check in :data:`VERIFICATION_CHECKS`
+        self.name = name
+        #: :data:`bool`: ``True`` is valid, ``False`` is invalid
+        self.passed = passed
+        #: :data:`str`: failure message, empty when passed
+        self.message = message
+        #: :data:`float`: duration of check in seconds
+        self.duration = duration
+        #: exception raised in check, ``None`` is completed check
+        self.exception = exception
+
+    def __repr__(self):
+        return '<CheckResult %s passed=%s duration=%.3f>' % (
+            self.name, self.passed, self.duration)
+
+
+class VerificationReport(object):
+    """The :class:`VerificationReport <VerificationReport>` object,
+    results of verification checks ordered as :data:`VERIFICATION_CHECKS`."""
+    def __init__(self, results):
+        #: :data:`list` of :class:`CheckResult <CheckResult>`
+        self.results = results
+
+    def __iter__(self):
+        return iter(self.results)
+
+    @property
+    def passed(self):
+        """``True`` is all checks are passed."""
+        return all(result.passed for result in self.results)
+
+    @property
+    def failures(self):
+        """list of failed :class:`CheckResult <CheckResult>`."""
+        return [result for result in self.results if not result.passed]
+
+
+def run_check(results, index, name, message, function):
+    """run a verification check and store :class:`CheckResult`.
+
+    :param list results: list to store result at index
+    :param int index: index of results
+    :param str name: name of check
+    :param str message: failure message of check
+    :param function function: check function returns ``True`` is valid
+    """
+    started = timer()
+    exception = None
+    try:
+        passed = function() is True
+        detail = message
+    except Exception as exc:  # pylint: disable=broad-except
+        passed = False
+        detail = '%s: %s' % (message, exc)
+        exception = exc
+    results[index] = CheckResult(name, passed, '' if passed else detail,
+                                 timer() - started, exception)
 
 
 def debsign_process(changes_path, passphrase=None, keyid=None,
-                    gnupghome=None, lintian=True, dput_host='local'):
+                    gnupghome=None, lintian=True, dput_host='local',
+                    fast_rewrite=False, resign=False, stage_hook=None,
+                    timeouts=None, retries=2, backoff=1.0,
+                    hash_cache=None, verify_artifacts=False, digests=None,
+                    output_dir=None, dput_command=DPUT_COMMAND,
+                    resign_gnupghome=None, errors=None):
+    # pylint: disable=too-many-locals
     """
-    debsign process sequence
+    debsign process sequence, runs :data:`STEPS` on an :class:`Upload`.
 
     :rtype: bool
     :return: ``True`` is valid, ``False`` is invalid.
@@ -348,45 +766,184 @@ def debsign_process(changes_path, passphrase=None, keyid=None,
 
         is defined in ``/etc/dput.cf`` in default
         cf. you know to print ``dput -H``.
+
+    :param bool fast_rewrite: ``True`` is patching checksum lines of .dsc
+
+        in .changes directly, and fall back to deb822 when the layout
+        of .changes is unexpected.
+
+    :param bool resign: ``True`` is stripping existing signatures of
+
+        .changes and .dsc, and signing them again with the key.
+        ValueError is raised when an existing signature is invalid,
+        good signatures made by expired keys are stripped.
+
+    :param function stage_hook: function returns context manager
+
+        wrapping each stage of :data:`STAGES`.
+
+    :param dict timeouts: timeout in seconds of each stage of ``sign``,
+
+        ``verify`` and ``dput``, e.g. ``{'sign': 60, 'dput': 600}``.
+
+    :param int retries: number of retries of gpg for transient failures
+    :param float backoff: seconds of first backoff, doubled each retry
+    :param hash_cache: :class:`HashCache <pydebsign.batch.HashCache>`
+
+        shared by uploads of a batch. only .dsc of each upload is
+        hashed unless ``verify_artifacts`` is ``True``.
+
+    :param bool verify_artifacts: ``True`` is verifying checksums of
+
+        all files of .changes.
+
+    :param tuple digests: algorithms of digests of optional checksum
+
+        fields written to .changes, the other checksum fields are
+        dropped. md5 of ``Files`` is always written. the checksum fields
+        of .changes are kept when this is None.
+
+    :param str output_dir: directory to write signed .changes and .dsc,
+
+        other files are hardlinked, reflinked or copied there.
+
+    :param str dput_command: dput command, e.g. a stand-in for tests
+    :param str resign_gnupghome: GnuPG home directory with public keys
+
+        of existing signatures (e.g. old keys of key rotation),
+        ``gnupghome`` is used when this is None.
+
+    :param list errors: list extended with :class:`StageError
+
+        <pydebsign.process.StageError>` of timeouts and retries,
+        also when an exception is raised.
+
+    :raises KeyError: dput host is not defined, no file is modified.
+    :raises StageError: gpg failed transiently or timed out
+
+        in all attempts.
     """
-    dbsg = Debsign(changes_path, passphrase=passphrase,
-                   keyid=keyid, gnupghome=gnupghome,
-                   lintian=lintian, dput_host=dput_host)
+    upload = Upload(Debsign(changes_path, passphrase=passphrase,
+                            keyid=keyid, gnupghome=gnupghome,
+                            lintian=lintian, dput_host=dput_host,
+                            fast_rewrite=fast_rewrite,
+                            stage_hook=stage_hook, timeouts=timeouts,
+                            retries=retries, backoff=backoff,
+                            hash_cache=hash_cache,
+                            verify_artifacts=verify_artifacts,
+                            digests=digests, output_dir=output_dir,
+                            dput_command=dput_command,
+                            resign_gnupghome=resign_gnupghome),
+                    resign)
+    try:
+        for step in STEPS:
+            step(upload)
+            if upload.result is not None:
+                break
+    finally:
+        if errors is not None:
+            errors.extend(upload.errors)
+    return upload.result
+
+
+class Upload(object):  # pylint: disable=too-few-public-methods
+    """The :class:`Upload <Upload>` object, state of debsign process
+    of a .changes passed through :data:`STEPS`."""
+    def __init__(self, dbsg, resign=False):
+        #: :class:`Debsign <Debsign>` of .changes
+        self.dbsg = dbsg
+        #: :data:`bool`: ``True`` is re-signing signed files
+        self.resign = resign
+        #: file list retrieved from .changes
+        self.file_list = None
+        #: size and checksums of .dsc
+        self.dsc_filesize = None
+        self.dsc_checksums = None
+        #: :data:`bool`: ``True`` is already signed .changes
+        self.verify_only = False
+        #: ``True`` is valid, ``False`` is failure of signing,
+        #: ``None`` is in progress.
+        self.result = None
+
+    @property
+    def errors(self):
+        """:data:`list` of :class:`StageError
+        <pydebsign.process.StageError>`, timeouts and retries occurred."""
+        return self.dbsg.runner.errors
+
+
+def prepare(upload):
+    """check dput host before any file is written, parse .changes
+    and strip signatures in re-sign mode."""
+    dbsg = upload.dbsg
+    dbsg.check_dput_host()
     dbsg.initialize()
-    file_list = dbsg.parse_changes()
+    if upload.resign:
+        dbsg.strip_signatures()
+    upload.file_list = dbsg.parse_changes()
+    upload.verify_only = dbsg.is_signed(dbsg.changes_path)
+
+
+def sign_dsc(upload):
+    """sign .dsc when not yet signed."""
+    if upload.verify_only or upload.dbsg.is_signed(upload.dbsg.dsc_path):
+        return
+    if upload.dbsg.signing_dsc() is False:
+        upload.result = False
+
+
+def hash_dsc(upload):
+    """retrieve size and checksums of .dsc."""
+    dbsg = upload.dbsg
+    upload.dsc_checksums = dbsg.checksums(dbsg.dsc_path)
+    upload.dsc_filesize = dbsg.retrieve_filesize(dbsg.dsc_path)
+
+
+def sign_changes(upload):
+    """rewrite .changes with size and checksums of .dsc, and sign it."""
+    if upload.verify_only:
+        return
+    dbsg = upload.dbsg
+    dbsg.rewrite_changes(upload.dsc_filesize, upload.dsc_checksums,
+                         upload.file_list)
+    if dbsg.signing_changes() is False:
+        upload.result = False
+        return
+    upload.file_list = dbsg.parse_changes()
 
-    if dbsg.is_signed(changes_path):
-        dsc_checksums = dbsg.retrieve_checksums(dbsg.dsc_path)
-        dsc_filesize = dbsg.retrieve_filesize(dbsg.dsc_path)
-        return dbsg.verification(dsc_filesize, dsc_checksums, file_list)
 
-    if dbsg.is_signed(dbsg.dsc_path) is False:
-        if dbsg.signing_dsc() is False:
-            return False
-    dsc_checksums = dbsg.retrieve_checksums(dbsg.dsc_path)
-    dsc_filesize = dbsg.retrieve_filesize(dbsg.dsc_path)
-    dbsg.rewrite_changes(dsc_filesize, dsc_checksums)
+def verify(upload, checks=None):
+    """verify signed files, see
+    :meth:`Debsign.verification() <Debsign.verification>`.
+
+    :param list checks: names of :data:`VERIFICATION_CHECKS`,
+                        default checks when this is None.
+    """
+    upload.result = upload.dbsg.verification(
+        upload.dsc_filesize, upload.dsc_checksums, upload.file_list, checks)
 
-    if dbsg.signing_changes() is False:
-        return False
-    signed_file_list = dbsg.parse_changes()
-    return dbsg.verification(dsc_filesize, dsc_checksums, signed_file_list)
 
+#: steps of debsign process, shared by :func:`debsign_process` and
+#: :mod:`pydebsign.pipeline`.
+STEPS = (prepare, sign_dsc, hash_dsc, sign_changes, verify)
 
-def rewrite_data(changes_obj, hash_type, filesize, hashdigest):
-    """rewrite .changes object with new file size and hashdigest.
 
-    :param `Deb822Dict` changes_obj: :class:`Deb822Dict` object
-    :param tuple hash_type: hash type of .changes
-    :param int filesize: expecting .dsc file size
-    :param str hashdigest: expecting .dsc hash digest
+def is_strippable(result):
     """
-    pattern = re.compile(r'.dsc\Z')
-    line = [line for line in changes_obj[hash_type[0]]
-            if pattern.search(line.get('name'))][0]
-    line_index = changes_obj[hash_type[0]].index(line)
-    changes_obj[hash_type[0]][line_index]['size'] = str(filesize)
-    changes_obj[hash_type[0]][line_index][hash_type[1]] = hashdigest
+    Check existing signature is strippable for re-signing,
+    a good signature made by expired key is strippable.
+
+    :rtype: bool
+    :return: ``True`` is good signature
+    :param `gnupg.Verify` result: result of verification
+    """
+    if result.valid:
+        return True
+    # gpg reports EXPKEYSIG instead of GOODSIG, and VALIDSIG
+    # only for cryptographically good signature.
+    return (getattr(result, 'key_status', None) ==
+            'signing key has expired' and
+            getattr(result, 'sig_timestamp', None) is not None)
 
 
 def check_encode(data):
@@ -400,20 +957,3 @@ def check_encode(data):
     """
     return (isinstance(data, bytes) and
             isinstance(data, str) is False)
-
-
-def check_dput_host(dput_host):
-    """
-    Check spcified host is defined in dput.cf
-
-    :rtype: bool
-    :return: ``True`` is dput_host is defined
-
-    :param str dput_host: dput host
-    """
-    command = '/usr/bin/dput -H'
-    args = shlex.split(command)
-    response = subprocess.check_output(args).decode('utf-8')
-    return dput_host in [host.split(' => ')[0]
-                         for host in response.split('\n')
-                         if len(host.split(' => ')) > 1]
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+pydebsign.files
+---------------
+
+file operations of debsign process; stripping clearsign wrappers,
+writing files atomically and staging files by hardlink, reflink or copy.
+
+----
+"""
+import os.path
+import shutil
+import tempfile
+import uuid
+
+
+#: ioctl request of Linux to clone file (reflink)
+FICLONE = 0x40049409
+
+
+def strip_clearsign(src, dst):
+    """copy clearsigned message from src to dst without signature.
+
+    :rtype: bool
+    :return: ``True`` is stripped, ``False`` is copied as is.
+
+    :param file src: binary file object of signed data
+    :param file dst: binary file object to write unsigned data
+    """
+    line = src.readline()
+    if not line.startswith(b'-----BEGIN PGP SIGNED MESSAGE-----'):
+        dst.write(line)
+        shutil.copyfileobj(src, dst)
+        return False
+    # skip armor headers such as "Hash: SHA256"
+    for line in src:
+        if not line.strip():
+            break
+    for line in src:
+        if line.startswith(b'-----BEGIN PGP SIGNATURE-----'):
+            break
+        if line.startswith(b'- '):
+            # dash-escaped text
+            line = line[2:]
+        dst.write(line)
+    return True
+
+
+def strip_file(file_path):
+    """strip clearsign wrapper of signed file in place without
+    verifying it, the file is replaced atomically.
+
+    :rtype: bool
+    :return: ``True`` is stripped, ``False`` is unsigned file.
+    :param str file_path: expecting .dsc file or .changes file.
+    """
+    fileno, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(file_path)))
+    try:
+        with open(file_path, 'rb') as src, os.fdopen(fileno, 'wb') as dst:
+            stripped = strip_clearsign(src, dst)
+        if stripped:
+            shutil.copymode(file_path, tmp_path)
+            os.rename(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return stripped
+
+
+def write_atomic(file_path, data):
+    """write data to temporary file and rename it to file path,
+    so readers never see partially written file.
+
+    :param str file_path: file path to write
+    :param str|bytes data: data, str is encoded with utf-8
+    """
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    fileno, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(file_path)))
+    try:
+        with os.fdopen(fileno, 'wb') as fileobj:
+            fileobj.write(data)
+            fileobj.flush()
+            os.fsync(fileobj.fileno())
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path)
+        os.rename(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def link_file(src, dst, copy=False):
+    """link or copy file atomically, replacing existing file.
+    hardlink is tried at first, then reflink, then copy.
+
+    :rtype: str
+    :return: ``hardlink``, ``reflink`` or ``copy``
+
+    :param str src: source file path
+    :param str dst: destination file path
+    :param bool copy: ``True`` is always copying file to modify it
+    """
+    if (copy is False and os.path.exists(dst) and
+            os.path.samefile(src, dst)):
+        return 'hardlink'
+    tmp_path = '%s.%s.tmp' % (dst, uuid.uuid4().hex)
+    try:
+        method = 'copy'
+        if copy is False:
+            try:
+                os.link(src, tmp_path)
+                method = 'hardlink'
+            except OSError:
+                try:
+                    reflink_file(src, tmp_path)
+                    method = 'reflink'
+                except (OSError, IOError):
+                    pass
+        if method == 'copy':
+            shutil.copy2(src, tmp_path)
+        os.rename(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return method
+
+
+def reflink_file(src, dst):
+    """clone file sharing data blocks (reflink) on Btrfs, XFS and so on.
+
+    :raises IOError: file system does not support reflink.
+
+    :param str src: source file path
+    :param str dst: destination file path
+    """
+    import fcntl
+    try:
+        with open(src, 'rb') as src_obj, open(dst, 'wb') as dst_obj:
+            fcntl.ioctl(dst_obj.fileno(), FICLONE, src_obj.fileno())
+        shutil.copystat(src, dst)
+    except (OSError, IOError):
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise
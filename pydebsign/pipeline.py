@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+pydebsign.pipeline
+------------------
+
+pipelined debsign process for many .changes files.
+
+each stage of debsign process has own worker threads, and the stages
+are connected with bounded queues. while a package is signed with gpg,
+the next package is parsed and hashed, and the previous package is
+checked with dput. full queues block previous stages, so memory is
+bounded.
+
+----
+"""
+import threading
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+from pydebsign import debsign
+from pydebsign.process import timer
+
+
+class Item(object):  # pylint: disable=too-few-public-methods
+    """The :class:`Item <Item>` object, a .changes flowing on pipeline."""
+    def __init__(self, index, changes_path):
+        #: :data:`int`: order of .changes
+        self.index = index
+        #: :data:`str`: .changes file path
+        self.changes_path = changes_path
+        #: :class:`Upload <pydebsign.debsign.Upload>` passed to
+        #: :data:`STEPS <pydebsign.debsign.STEPS>`
+        self.upload = None
+        #: :data:`bool`: ``True`` is finished, remaining stages are skipped
+        self.finished = False
+        #: ``True``, ``False`` or raised exception
+        self.result = None
+
+    def finish(self, result):
+        """
+        finish the item.
+
+        :param result: ``True``, ``False`` or raised exception
+        """
+        self.finished = True
+        self.result = result
+
+
+def run_step(item, step, *args):
+    """run a step of :data:`STEPS <pydebsign.debsign.STEPS>`,
+    finish the item when the step settles the result."""
+    step(item.upload, *args)
+    if item.upload.result is not None:
+        item.finish(item.upload.result)
+
+
+def parse(item, options):
+    """parse .changes, strip signatures in re-sign mode."""
+    item.upload = debsign.Upload(
+        debsign.Debsign(item.changes_path, **options['debsign']),
+        options['resign'])
+    run_step(item, debsign.prepare)
+
+
+def sign_dsc(item, _):
+    """sign .dsc when not yet signed."""
+    run_step(item, debsign.sign_dsc)
+
+
+def hash_dsc(item, _):
+    """retrieve size and checksums of .dsc."""
+    run_step(item, debsign.hash_dsc)
+
+
+def sign_changes(item, _):
+    """rewrite .changes with .dsc checksums, and sign it."""
+    run_step(item, debsign.sign_changes)
+
+
+def verify(item, _):
+    """verify signed files except ``dput``, the result is settled
+    by :func:`dput`."""
+    debsign.verify(item.upload, [name for name in
+                                 item.upload.dbsg.default_checks()
+                                 if name != 'dput'])
+
+
+def dput(item, _):
+    """verify signed files with ``dput``."""
+    run_step(item, debsign.verify, ['dput'])
+
+
+#: stages of pipeline
+STAGES = (('parse', parse),
+          ('sign_dsc', sign_dsc),
+          ('hash', hash_dsc),
+          ('sign_changes', sign_changes),
+          ('verify', verify),
+          ('dput', dput))
+
+
+class Stage(object):
+    """The :class:`Stage <Stage>` object, worker threads of a stage."""
+    def __init__(self, name, function, workers):
+        #: :data:`str`: name of stage
+        self.name = name
+        #: :data:`function`: function of stage
+        self.function = function
+        #: :data:`int`: number of worker threads
+        self.workers = workers
+        #: :data:`int`: number of processed items
+        self.items = 0
+        #: :data:`float`: total busy time of workers in seconds
+        self.busy = 0.0
+        self._lock = threading.Lock()
+        self._running = 0
+
+    def reset(self):
+        """reset counters before run."""
+        self.items = 0
+        self.busy = 0.0
+        self._running = self.workers
+
+    def run(self, source, sink, readers, options):
+        """
+        worker thread, process items from source and put them to sink.
+
+        :param `queue.Queue` source: queue of input items
+        :param `queue.Queue` sink: queue of output items
+        :param int readers: number of threads reading sink
+        :param dict options: options of stage functions
+        """
+        while True:
+            item = source.get()
+            if item is None:
+                break
+            if not item.finished:
+                started = timer()
+                try:
+                    self.function(item, options)
+                except Exception as exc:  # pylint: disable=broad-except
+                    item.finish(exc)
+                with self._lock:
+                    self.items += 1
+                    self.busy += timer() - started
+            sink.put(item)
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            for _ in range(readers):
+                sink.put(None)
+
+
+class Pipeline(object):
+    """The :class:`Pipeline <Pipeline>` object."""
+    def __init__(self, workers=None, queue_size=2, resign=False,
+                 stages=STAGES, **kwargs):
+        """
+        :param dict workers: number of worker threads of each stage
+
+            in :data:`STAGES`, 1 when missing.
+
+        :param int queue_size: maximum number of items between stages
+        :param bool resign: ``True`` is re-signing signed files
+        :param tuple stages: names and functions of stages
+        :param kwargs: keyword arguments of
+                       :class:`Debsign <pydebsign.debsign.Debsign>`
+        """
+        workers = workers or {}
+        #: :data:`list` of :class:`Stage <Stage>`
+        self.stages = [Stage(name, function, workers.get(name, 1))
+                       for name, function in stages]
+        #: :data:`int`: maximum number of items between stages
+        self.queue_size = queue_size
+        self._options = {'debsign': kwargs, 'resign': resign}
+        self._elapsed = 0.0
+
+    def run(self, changes_paths):
+        """
+        debsign process of .changes files on pipeline.
+
+        :rtype: list
+        :return: list of tuple of .changes file path, result and errors,
+                 result is ``True``, ``False`` or raised exception,
+                 errors is list of :class:`StageError
+                 <pydebsign.process.StageError>` of timeouts and retries.
+
+        :param list changes_paths: .changes file paths
+        """
+        started = timer()
+        queues = [queue.Queue(self.queue_size)
+                  for _ in range(len(self.stages) + 1)]
+        readers = [stage.workers for stage in self.stages[1:]] + [1]
+        threads = []
+        for index, stage in enumerate(self.stages):
+            stage.reset()
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=stage.run,
+                    args=(queues[index], queues[index + 1], readers[index],
+                          self._options)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        feeder = threading.Thread(target=self._feed,
+                                  args=(changes_paths, queues[0]))
+        feeder.daemon = True
+        feeder.start()
+        items = []
+        while True:
+            item = queues[-1].get()
+            if item is None:
+                break
+            items.append(item)
+        self._elapsed = timer() - started
+        return [(item.changes_path, item.result,
+                 [] if item.upload is None else item.upload.errors)
+                for item in sorted(items, key=lambda item: item.index)]
+
+    def _feed(self, changes_paths, sink):
+        """feed .changes files to the first stage."""
+        for index, changes_path in enumerate(changes_paths):
+            sink.put(Item(index, changes_path))
+        for _ in range(self.stages[0].workers):
+            sink.put(None)
+
+    def utilization(self):
+        """
+        utilization of stages at the last run.
+
+        :rtype: dict
+        :return: items, busy time and utilization of each stage,
+
+            utilization is busy time per worker and elapsed time.
+        """
+        return dict((stage.name,
+                     {'items': stage.items,
+                      'busy': stage.busy,
+                      'utilization': (stage.busy / stage.workers /
+                                      self._elapsed
+                                      if self._elapsed else 0.0)})
+                    for stage in self.stages)
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+pydebsign.process
+-----------------
+
+processes of gpg, dput and lintian with timeouts.
+
+each stage of debsign process is run by :class:`StageRunner`,
+the processes started in the stage are watched by :class:`Watchdog`
+and their process groups are killed after the timeout of the stage.
+gpg operations are retried with backoff for transient failures of
+gpg-agent.
+
+----
+"""
+import contextlib
+import os
+import re
+import shlex
+import signal
+import sys
+import threading
+import time
+import warnings
+
+# gnupg and subprocess are imported at first use
+# to keep cold start of short-lived invocations fast.
+
+
+#: messages of gpg for transient failures of gpg-agent
+TRANSIENT_GPG_ERRORS = re.compile(r"problem with the agent|"
+                                  r"can't connect to the agent|"
+                                  r"no gpg-agent running|"
+                                  r"signing failed: Timeout", re.I)
+
+#: default dput command
+DPUT_COMMAND = '/usr/bin/dput'
+
+#: versions of python-gnupg supported by :func:`watched_gpg`,
+#: lower bound is included and upper bound is excluded.
+GNUPG_VERSIONS = ((0, 3, 8), (0, 6))
+
+#: clock for durations
+timer = getattr(time,  # pylint: disable=invalid-name
+                'perf_counter', time.time)
+
+
+class StageError(RuntimeError):
+    """The :class:`StageError <StageError>` object,
+    failure of a stage such as transient failure of gpg-agent."""
+    def __init__(self, stage, kind, attempt, elapsed, message):
+        RuntimeError.__init__(self, stage, kind, attempt, elapsed, message)
+        #: :data:`str`: name of :data:`STAGES <pydebsign.debsign.STAGES>`
+        self.stage = stage
+        #: :data:`str`: ``timeout`` or ``transient``
+        self.kind = kind
+        #: :data:`int`: number of attempt, first attempt is 1
+        self.attempt = attempt
+        #: :data:`float`: elapsed time of attempt in seconds
+        self.elapsed = elapsed
+        #: :data:`str`: detail of failure
+        self.message = message
+
+    def __str__(self):
+        return '%s stage %s at attempt %d (%.1fs): %s' % (
+            self.stage, self.kind, self.attempt, self.elapsed, self.message)
+
+    def as_dict(self):
+        """
+        error as dictionary, e.g. to write in JSON.
+
+        :rtype: dict
+        :return: stage, kind, attempt, elapsed and message
+        """
+        return {'stage': self.stage, 'kind': self.kind,
+                'attempt': self.attempt, 'elapsed': self.elapsed,
+                'message': self.message}
+
+
+class StageTimeout(StageError):
+    """The :class:`StageTimeout <StageTimeout>` object,
+    processes of the stage are killed after timeout."""
+    def __init__(self, stage, attempt, elapsed, message):
+        StageError.__init__(self, stage, 'timeout', attempt, elapsed,
+                            message)
+
+
+class Watchdog(object):
+    """The :class:`Watchdog <Watchdog>` object,
+    context manager killing watched processes after timeout."""
+    def __init__(self, timeout):
+        #: :data:`float`: timeout in seconds, ``None`` is no timeout
+        self.timeout = timeout
+        #: :data:`bool`: ``True`` is timed out and processes are killed
+        self.fired = False
+        self._processes = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def __enter__(self):
+        if self.timeout is not None:
+            self._timer = threading.Timer(self.timeout, self.kill)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def watch(self, process, group=False):
+        """
+        watch process, killed at once when already timed out.
+
+        :param `subprocess.Popen` process: process to watch
+        :param bool group: ``True`` is killing process group of process
+        """
+        with self._lock:
+            self._processes.append((process, group))
+            fired = self.fired
+        if fired:
+            kill_process(process, group)
+
+    def kill(self):
+        """kill watched processes."""
+        with self._lock:
+            self.fired = True
+            processes = list(self._processes)
+        for process, group in processes:
+            kill_process(process, group)
+
+
+class StageRunner(object):
+    """The :class:`StageRunner <StageRunner>` object,
+    runs stages of debsign process with stage hook, timeouts and retries.
+    """
+    def __init__(self, stage_hook=None, timeouts=None, retries=2,
+                 backoff=1.0):
+        #: function called with a name of
+        #: :data:`STAGES <pydebsign.debsign.STAGES>`, returns context
+        #: manager wrapping the stage (e.g. limiting concurrency by
+        #: :mod:`pydebsign.scheduler`).
+        self.stage_hook = stage_hook
+        #: :data:`dict`: timeout in seconds of each stage of
+        #: ``sign``, ``verify`` and ``dput``, no timeout when missing.
+        self.timeouts = timeouts or {}
+        #: :data:`int`: number of retries of gpg for transient failures
+        #: of gpg-agent and timeouts.
+        self.retries = retries
+        #: :data:`float`: seconds of first backoff, doubled each retry
+        self.backoff = backoff
+        #: :data:`list` of :class:`StageError <StageError>`,
+        #: timeouts and retries occurred.
+        self.errors = []
+        self._local = threading.local()
+
+    def stage(self, name):
+        """
+        context manager wrapping a stage with ``stage_hook``.
+
+        :param str name: name of :data:`STAGES <pydebsign.debsign.STAGES>`
+        """
+        if self.stage_hook is None:
+            return null_stage()
+        return self.stage_hook(name)
+
+    def watch(self, process):
+        """
+        watch process group of gpg by watchdog of the current thread,
+        passed to :func:`watched_gpg`.
+
+        :param `subprocess.Popen` process: gpg process
+        """
+        watchdog = getattr(self._local, 'watchdog', None)
+        if watchdog is not None:
+            watchdog.watch(process, group=True)
+
+    def run_gpg(self, stage, function, *args, **kwargs):
+        """
+        run gpg operation with watchdog of timeout, and retry it
+        with backoff for transient failures of gpg-agent.
+
+        :return: return value of function
+        :raises StageTimeout: timed out in the last attempt.
+        :raises StageError: transient failure in all attempts.
+
+        :param str stage: ``sign`` or ``verify``
+        :param function function: method of :class:`gnupg.GPG`
+        """
+        timeout = self.timeouts.get(stage)
+        attempt = 0
+        while True:
+            attempt += 1
+            started = timer()
+            self._local.watchdog = Watchdog(timeout)
+            try:
+                with self.stage(stage), self._local.watchdog as watchdog:
+                    result = function(*args, **kwargs)
+            finally:
+                self._local.watchdog = None
+            elapsed = timer() - started
+            if watchdog.fired:
+                error = StageTimeout(stage, attempt, elapsed,
+                                     'gpg is killed after %ss' % timeout)
+            else:
+                transient = TRANSIENT_GPG_ERRORS.search(
+                    getattr(result, 'stderr', None) or '')
+                if transient is None:
+                    return result
+                error = StageError(stage, 'transient', attempt, elapsed,
+                                   transient.group(0))
+            self.errors.append(error)
+            if attempt > self.retries:
+                raise error
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+
+    def run_command(self, stage, args, stdout=None):
+        """
+        run command with timeout of stage, see :func:`call_command`.
+
+        :rtype: tuple
+        :return: return code and output of command
+        :raises StageTimeout: timed out.
+
+        :param str stage: ``dput``
+        :param list args: command arguments
+        :param int stdout: ``subprocess.PIPE`` to capture output
+        """
+        try:
+            return call_command(stage, args, self.timeouts.get(stage),
+                                stdout)
+        except StageTimeout as error:
+            self.errors.append(error)
+            raise
+
+
+@contextlib.contextmanager
+def null_stage():
+    """context manager of stage without ``stage_hook``."""
+    yield
+
+
+def kill_process(process, group=False):
+    """kill process or process group, ignore finished process.
+
+    :param `subprocess.Popen` process: process to kill
+    :param bool group: ``True`` is killing process group of process
+    """
+    try:
+        if group:
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass
+
+
+def new_session():
+    """
+    keyword arguments of :class:`subprocess.Popen` starting process
+    in a new session, so the process group is killed at once.
+
+    :rtype: dict
+    """
+    if sys.version_info < (3, 2):
+        return dict(preexec_fn=os.setsid)
+    return dict(start_new_session=True)
+
+
+def call_command(stage, args, timeout=None, stdout=None):
+    """run command in a new process group with watchdog of timeout,
+    the process group is killed when timed out.
+
+    :rtype: tuple
+    :return: return code and output of command
+    :raises StageTimeout: timed out.
+
+    :param str stage: name of :data:`STAGES <pydebsign.debsign.STAGES>`
+    :param list args: command arguments
+    :param float timeout: timeout in seconds, ``None`` is no timeout
+    :param int stdout: ``subprocess.PIPE`` to capture output
+    """
+    import subprocess
+    started = timer()
+    with Watchdog(timeout) as watchdog:
+        process = subprocess.Popen(args, stdout=stdout, **new_session())
+        watchdog.watch(process, group=True)
+        output = process.communicate()[0]
+    if watchdog.fired:
+        raise StageTimeout(stage, 1, timer() - started,
+                           '%s is killed after %ss' % (args[0], timeout))
+    return process.returncode, output
+
+
+def check_dput_host(dput_host, timeout=None, dput_command=DPUT_COMMAND):
+    """
+    Check spcified host is defined in dput.cf,
+    ``dput -H`` is invoked only once per process for each dput command.
+
+    :rtype: bool
+    :return: ``True`` is dput_host is defined
+    :raises StageTimeout: ``dput -H`` is timed out.
+
+    :param str dput_host: dput host
+    :param float timeout: timeout of ``dput -H`` in seconds
+    :param str dput_command: dput command
+    """
+    with _DPUT_HOSTS_LOCK:
+        if dput_command not in _DPUT_HOSTS:
+            import subprocess
+            command = '%s -H' % dput_command
+            args = shlex.split(command)
+            returncode, response = call_command('dput', args, timeout,
+                                                subprocess.PIPE)
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, args)
+            response = response.decode('utf-8')
+            _DPUT_HOSTS[dput_command] = [host.split(' => ')[0]
+                                         for host in response.split('\n')
+                                         if len(host.split(' => ')) > 1]
+        return dput_host in _DPUT_HOSTS[dput_command]
+
+
+#: cache of host identifiers printed by ``dput -H`` of each command
+_DPUT_HOSTS = {}
+_DPUT_HOSTS_LOCK = threading.Lock()
+
+
+def watched_gpg(watch, **options):
+    """
+    create :class:`gnupg.GPG` object passing gpg processes to watch.
+
+    python-gnupg has no public hook to get gpg processes or to time out
+    operations, so this is a compatibility shim overriding internal
+    ``GPG._open_subprocess`` of python-gnupg of :data:`GNUPG_VERSIONS`.
+    gpg is started in a new session as the original method, so the
+    process group is killed by :class:`Watchdog`. other versions of
+    python-gnupg are used as is with a warning, and timeouts of
+    ``sign`` and ``verify`` are not enforced.
+
+    :rtype: :class:`gnupg.GPG`
+    :param function watch: function called with started gpg process
+    :param options: keyword arguments of :class:`gnupg.GPG`
+    """
+    import gnupg
+    gpg_class = _GPG_CLASSES.get(gnupg.GPG)
+    if gpg_class is None:
+        gpg_class = _GPG_CLASSES[gnupg.GPG] = _watched_gpg_class(gnupg)
+    if gpg_class is gnupg.GPG:
+        return gnupg.GPG(**options)
+    return gpg_class(watch, **options)
+
+
+def _watched_gpg_class(gnupg):
+    """subclass of :class:`gnupg.GPG` for :func:`watched_gpg`,
+    :class:`gnupg.GPG` itself for unsupported version."""
+    version = tuple(int(number) for number in
+                    re.findall(r'\d+', getattr(gnupg, '__version__', ''))[:3])
+    if (not GNUPG_VERSIONS[0] <= version < GNUPG_VERSIONS[1] or
+            not hasattr(gnupg.GPG, '_open_subprocess') or
+            not hasattr(gnupg.GPG, 'make_args')):
+        warnings.warn('python-gnupg %s is not supported, timeouts of gpg '
+                      'are not enforced' % getattr(gnupg, '__version__', ''),
+                      RuntimeWarning)
+        return gnupg.GPG
+
+    class WatchedGPG(gnupg.GPG):  # pylint: disable=too-few-public-methods
+        """:class:`gnupg.GPG` passing gpg processes to watch."""
+        def __init__(self, watch, **options):
+            # GPG.__init__() runs gpg to check the version.
+            self.watch = watch
+            gnupg.GPG.__init__(self, **options)
+
+        def _open_subprocess(self, args, passphrase=False):
+            import subprocess
+            process = subprocess.Popen(
+                self.make_args(args, passphrase),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=getattr(self, 'env', None),
+                **new_session())
+            self.watch(process)
+            return process
+    return WatchedGPG
+
+
+#: subclasses of :class:`gnupg.GPG` created by :func:`watched_gpg`
+_GPG_CLASSES = {}
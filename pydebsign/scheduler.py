@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+pydebsign.scheduler
+-------------------
+
+scheduler of debsign process for many .changes files.
+
+the stages of :data:`STAGES <pydebsign.debsign.STAGES>` are limited by
+two gates, CPU-bound stages (hashing, dput and lintian) and
+gpg-agent-bound stages (signing, verifying signatures).
+jobs and waiters of gates are served in order of priority,
+so a security upload jumps ahead of bulk rebuilds.
+
+----
+"""
+import contextlib
+import heapq
+import itertools
+import multiprocessing
+import threading
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+from pydebsign.debsign import debsign_process
+from pydebsign.process import null_stage, timer
+
+
+#: priority of urgent job such as security upload
+PRIORITY_URGENT = 0
+#: priority of normal job
+PRIORITY_NORMAL = 50
+#: priority of bulk job such as rebuilds
+PRIORITY_BULK = 100
+
+#: gate limiting each stage of debsign process
+STAGE_GATES = {'hash': 'cpu',
+               'dput': 'cpu',
+               'sign': 'agent',
+               'verify': 'agent'}
+
+
+class PriorityGate(object):  # pylint: disable=too-many-instance-attributes
+    """The :class:`PriorityGate <PriorityGate>` object,
+    bounded slots handed to waiters in order of priority."""
+    def __init__(self, slots):
+        #: :data:`int`: number of concurrent slots
+        self.slots = slots
+        self._busy = 0
+        self._waiters = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._acquired = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquire(self, priority=PRIORITY_NORMAL):
+        """
+        acquire a slot, wait until the slot is handed over.
+
+        :param int priority: smaller is more urgent
+        """
+        started = timer()
+        with self._lock:
+            if self._busy < self.slots and not self._waiters:
+                self._busy += 1
+                event = None
+            else:
+                event = threading.Event()
+                heapq.heappush(self._waiters,
+                               (priority, next(self._counter), event))
+        if event is not None:
+            event.wait()
+        waited = timer() - started
+        with self._lock:
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+    def release(self):
+        """release a slot, hand it over to the most urgent waiter."""
+        with self._lock:
+            if self._waiters:
+                heapq.heappop(self._waiters)[2].set()
+            else:
+                self._busy -= 1
+
+    @contextlib.contextmanager
+    def slot(self, priority=PRIORITY_NORMAL):
+        """
+        context manager holding a slot.
+
+        :param int priority: smaller is more urgent
+        """
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def metrics(self):
+        """
+        metrics of gate.
+
+        :rtype: dict
+        :return: slots, busy, waiting, acquired, wait_total, wait_max
+        """
+        with self._lock:
+            return {'slots': self.slots,
+                    'busy': self._busy,
+                    'waiting': len(self._waiters),
+                    'acquired': self._acquired,
+                    'wait_total': self._wait_total,
+                    'wait_max': self._wait_max}
+
+
+class Job(object):  # pylint: disable=too-many-instance-attributes
+    """The :class:`Job <Job>` object, a .changes submitted to scheduler."""
+    def __init__(self, changes_path, priority, kwargs):
+        #: :data:`str`: .changes file path
+        self.changes_path = changes_path
+        #: :data:`int`: priority, smaller is more urgent
+        self.priority = priority
+        #: :data:`dict`: keyword arguments of debsign_process()
+        self.kwargs = kwargs
+        #: :data:`float`: time of submitted, started and finished
+        self.submitted = timer()
+        self.started = None
+        self.finished = None
+        #: return value of debsign_process()
+        self.value = None
+        #: raised exception of debsign_process()
+        self.exception = None
+        #: :data:`list` of :class:`StageError
+        #: <pydebsign.process.StageError>`, timeouts and retries occurred
+        self.errors = kwargs.setdefault('errors', [])
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """
+        wait until job is finished.
+
+        :rtype: bool
+        :return: ``True`` is finished.
+        :param float timeout: timeout in seconds
+        """
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    def get(self, timeout=None):
+        """
+        wait and get the result of debsign_process().
+
+        :rtype: bool
+        :return: ``True`` is valid, ``False`` is invalid.
+        :param float timeout: timeout in seconds
+        :raises: exception raised by debsign_process().
+        """
+        if self.wait(timeout) is False:
+            raise RuntimeError('%s is not finished' % self.changes_path)
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
+class Scheduler(object):  # pylint: disable=too-many-instance-attributes
+    """The :class:`Scheduler <Scheduler>` object."""
+    def __init__(self, workers=4, cpu_slots=None, agent_slots=1):
+        #: :data:`dict`: gates of ``cpu`` and ``agent`` stages
+        self.gates = {'cpu': PriorityGate(cpu_slots or
+                                          multiprocessing.cpu_count()),
+                      'agent': PriorityGate(agent_slots)}
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._running = 0
+        self._completed = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+        self._threads = [threading.Thread(target=self._work)
+                         for _ in range(workers)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(self, changes_path, priority=PRIORITY_NORMAL, **kwargs):
+        """
+        submit a .changes to debsign process.
+
+        :rtype: :class:`Job <Job>`
+        :return: submitted job
+
+        :param str changes_path: .changes file path
+        :param int priority: :data:`PRIORITY_URGENT`, :data:`PRIORITY_NORMAL`,
+
+            :data:`PRIORITY_BULK` or any integer, smaller is more urgent.
+
+        :param kwargs: keyword arguments of
+                       :func:`debsign_process()
+                       <pydebsign.debsign.debsign_process>`,
+                       ``stage_hook`` is entered inside the gates.
+        """
+        job = Job(changes_path, priority, kwargs)
+        self._queue.put((priority, next(self._counter), job))
+        return job
+
+    def shutdown(self, wait=True):
+        """
+        stop workers after the submitted jobs.
+
+        :param bool wait: ``True`` is waiting workers
+        """
+        for _ in self._threads:
+            self._queue.put((float('inf'), next(self._counter), None))
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def metrics(self):
+        """
+        metrics of scheduler.
+
+        :rtype: dict
+        :return: queue_depth, running, completed, queue wait times
+                 and metrics of each gate.
+        """
+        with self._lock:
+            metrics = {'queue_depth': self._queue.qsize(),
+                       'running': self._running,
+                       'completed': self._completed,
+                       'queue_wait_total': self._queue_wait_total,
+                       'queue_wait_max': self._queue_wait_max}
+        metrics['gates'] = dict((name, gate.metrics())
+                                for name, gate in self.gates.items())
+        return metrics
+
+    def stage_hook(self, priority, stage_hook=None):
+        """
+        stage hook of Debsign limiting stages by gates.
+
+        :rtype: function
+        :return: function returns context manager of a stage
+        :param int priority: smaller is more urgent
+        :param function stage_hook: stage hook given to ``submit()``,
+
+            entered while holding the slot of the gate.
+        """
+        return lambda stage: self.gated_stage(stage, priority, stage_hook)
+
+    @contextlib.contextmanager
+    def gated_stage(self, stage, priority, stage_hook=None):
+        """
+        context manager of a stage holding the slot of its gate.
+
+        :param str stage: name of :data:`STAGES <pydebsign.debsign.STAGES>`
+        :param int priority: smaller is more urgent
+        :param function stage_hook: stage hook given to ``submit()``
+        """
+        with self.gates[STAGE_GATES[stage]].slot(priority):
+            with (null_stage() if stage_hook is None
+                  else stage_hook(stage)):
+                yield
+
+    def _work(self):
+        """worker thread."""
+        while True:
+            job = self._queue.get()[2]
+            if job is None:
+                break
+            job.started = timer()
+            waited = job.started - job.submitted
+            with self._lock:
+                self._running += 1
+                self._queue_wait_total += waited
+                self._queue_wait_max = max(self._queue_wait_max, waited)
+            kwargs = dict(job.kwargs)
+            kwargs['stage_hook'] = self.stage_hook(
+                job.priority, kwargs.get('stage_hook'))
+            try:
+                job.value = debsign_process(job.changes_path, **kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                job.exception = exc
+            job.finished = timer()
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+            job._done.set()  # pylint: disable=protected-access
@@ -0,0 +1,544 @@
+# -*- coding: utf-8 -*-
+"""
+pydebsign.spool
+---------------
+
+work queue of debsign process shared by workers on several hosts.
+
+a spool is a directory (e.g. on NFS) including .changes files and
+referenced files. a worker claims a .changes with a lease, a lock file
+``<.changes>.lock`` created exclusively, and renews it by heartbeat
+while signing. the .dsc is locked by a lease too, because some .changes
+may reference the same .dsc. a lease not renewed in the duration is
+expired, so jobs of dead workers are requeued automatically.
+expiry is measured with the clock of the file server, mtime of a
+touched probe file, so clocks of worker hosts are never compared.
+a worker checks its leases between stages, and aborts the job when
+a lease is lost.
+
+finished jobs are marked with ``<.changes>.done`` or
+``<.changes>.failed`` in the :data:`MARKER_DIR` subdirectory of the
+spool, so they are listed at once and never claimed again. claiming
+stops at the first lease acquired, and starts at a random offset so
+workers do not contend for the same jobs.
+
+----
+"""
+import contextlib
+import errno
+import json
+import multiprocessing
+import os
+import os.path
+import random
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from pydebsign.debsign import Debsign, debsign_process
+from pydebsign.files import write_atomic
+from pydebsign.process import null_stage
+
+
+#: default duration of lease in seconds
+LEASE_DURATION = 300
+
+#: subdirectory of spool including markers of finished jobs
+MARKER_DIR = 'done'
+
+
+def worker_id():
+    """
+    identifier of worker.
+
+    :rtype: str
+    :return: host name, process id and random string
+    """
+    return '%s:%d:%s' % (socket.gethostname(), os.getpid(),
+                         uuid.uuid4().hex[:8])
+
+
+class Lease(object):
+    """The :class:`Lease <Lease>` object, lock file with expiry."""
+    def __init__(self, path, owner, duration=LEASE_DURATION):
+        #: :data:`str`: lock file path
+        self.path = path
+        #: :data:`str`: owner written in lock file
+        self.owner = owner
+        #: :data:`float`: duration in seconds from last renewal
+        self.duration = duration
+
+    def acquire(self, now=None):
+        """
+        acquire lease, break expired lease of another owner.
+
+        :rtype: bool
+        :return: ``True`` is acquired, ``False`` is owned by another.
+        :param float now: time of file server, ``server_time()`` is
+
+            probed when this is None.
+        """
+        for _ in range(2):
+            try:
+                fileno = os.open(self.path,
+                                 os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+                if self._break_expired(now) is False:
+                    return False
+                continue
+            with os.fdopen(fileno, 'w') as fileobj:
+                fileobj.write(self.owner)
+            return True
+        return False
+
+    def wait(self, interval=1.0):
+        """
+        acquire lease, wait until released or expired.
+
+        :param float interval: polling interval in seconds
+        """
+        while self.acquire() is False:
+            time.sleep(interval)
+
+    def renew(self):
+        """
+        renew lease by updating mtime of lock file.
+
+        :rtype: bool
+        :return: ``True`` is renewed, ``False`` is lost lease.
+        """
+        if self.is_owned() is False:
+            return False
+        os.utime(self.path, None)
+        return True
+
+    def release(self):
+        """
+        release lease when owned. the lock file is moved away before
+        checking the owner, so a lease taken over by another worker
+        is never removed.
+        """
+        released = '%s.%s' % (self.path, uuid.uuid4().hex)
+        try:
+            os.rename(self.path, released)
+        except OSError:
+            return
+        with open(released) as fileobj:
+            owned = fileobj.read() == self.owner
+        if owned is False:
+            # give it back to the owner
+            try:
+                os.link(released, self.path)
+            except OSError:
+                pass
+        os.remove(released)
+
+    def is_owned(self):
+        """
+        check lock file is owned.
+
+        :rtype: bool
+        :return: ``True`` is owned.
+        """
+        try:
+            with open(self.path) as fileobj:
+                return fileobj.read() == self.owner
+        except IOError:
+            return False
+
+    def _break_expired(self, now=None):
+        """
+        break expired lease.
+
+        :rtype: bool
+        :return: ``True`` is broken or released, ``False`` is alive.
+        :param float now: time of file server
+        """
+        if now is None:
+            now = self.server_time()
+        try:
+            if os.stat(self.path).st_mtime + self.duration > now:
+                return False
+        except OSError:
+            return True
+        # rename is atomic, only one of the workers breaks the lease.
+        expired = '%s.%s' % (self.path, uuid.uuid4().hex)
+        try:
+            os.rename(self.path, expired)
+        except OSError:
+            return True
+        if os.stat(expired).st_mtime + self.duration > now:
+            # renewed or taken over by another worker in the meantime,
+            # give it back.
+            try:
+                os.link(expired, self.path)
+            except OSError:
+                pass
+            os.remove(expired)
+            return False
+        os.remove(expired)
+        return True
+
+    def server_time(self):
+        """
+        current time of the file server of lock file.
+
+        :rtype: float
+        :return: mtime of a probe file touched as renew()
+        """
+        fileno, probe = tempfile.mkstemp(
+            prefix='.lease-', dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            os.close(fileno)
+            os.utime(probe, None)
+            return os.stat(probe).st_mtime
+        finally:
+            os.remove(probe)
+
+
+class LeaseLost(RuntimeError):
+    """The :class:`LeaseLost <LeaseLost>` object,
+    lease of the job is lost and the job is aborted."""
+
+
+class Heartbeat(threading.Thread):
+    """The :class:`Heartbeat <Heartbeat>` object,
+    thread renewing leases periodically."""
+    def __init__(self, leases, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        #: :data:`list` of :class:`Lease <Lease>`
+        self.leases = leases
+        #: :data:`float`: interval of renewal in seconds
+        self.interval = interval
+        #: :data:`bool`: ``True`` is some lease is lost
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            for lease in list(self.leases):
+                if lease.renew() is False:
+                    self.lost = True
+
+    def stop(self):
+        """stop renewal."""
+        self._stop_event.set()
+        self.join()
+
+
+class Spool(object):
+    """The :class:`Spool <Spool>` object."""
+    def __init__(self, path, lease=LEASE_DURATION):
+        #: :data:`str`: spool directory path
+        self.path = os.path.abspath(path)
+        #: :data:`float`: duration of lease in seconds
+        self.lease = lease
+
+    def pending(self):
+        """
+        .changes files not finished yet, including claimed ones.
+
+        :rtype: list
+        :return: sorted .changes file paths
+        """
+        finished = self.finished()
+        return sorted(changes_path
+                      for changes_path, _ in self._scan(finished))
+
+    def finished(self):
+        """
+        .changes files of finished jobs, listed from :data:`MARKER_DIR`.
+
+        :rtype: set
+        :return: .changes file paths
+        """
+        marker_dir = os.path.join(self.path, MARKER_DIR)
+        paths = set()
+        for dirpath, _, filenames in os.walk(marker_dir):
+            for filename in filenames:
+                name, suffix = os.path.splitext(filename)
+                if suffix in ('.done', '.failed'):
+                    paths.add(os.path.normpath(os.path.join(
+                        self.path, os.path.relpath(dirpath, marker_dir),
+                        name)))
+        return paths
+
+    def marker(self, changes_path, suffix):
+        """
+        marker file path of finished job.
+
+        :rtype: str
+        :return: path in :data:`MARKER_DIR`
+        :param str changes_path: .changes file path
+        :param str suffix: ``done`` or ``failed``
+        """
+        return os.path.join(self.path, MARKER_DIR,
+                            '%s.%s' % (os.path.relpath(changes_path,
+                                                       self.path),
+                                       suffix))
+
+    def is_finished(self, changes_path):
+        """
+        check job of .changes is finished.
+
+        :rtype: bool
+        :return: ``True`` is done or failed
+        :param str changes_path: .changes file path
+        """
+        return (os.path.exists(self.marker(changes_path, 'done')) or
+                os.path.exists(self.marker(changes_path, 'failed')))
+
+    def claim(self, owner):
+        """
+        claim a pending .changes, stop at the first lease acquired.
+        .changes with a lock file are tried after the others, only
+        to break expired leases.
+
+        :rtype: tuple
+        :return: .changes file path and :class:`Lease <Lease>`,
+
+            ``None`` is no claimable job.
+
+        :param str owner: identifier of worker
+        """
+        locked = []
+        for changes_path, has_lock in self._scan(self.finished(),
+                                                 random.random()):
+            if has_lock:
+                locked.append(changes_path)
+                continue
+            claimed = self._claim(changes_path, owner)
+            if claimed is not None:
+                return claimed
+        now = None
+        if locked:
+            # probe time of file server once for all locked jobs
+            now = Lease('%s.lock' % locked[0], owner).server_time()
+        for changes_path in locked:
+            claimed = self._claim(changes_path, owner, now)
+            if claimed is not None:
+                return claimed
+        return None
+
+    def _claim(self, changes_path, owner, now=None):
+        """claim a .changes, ``None`` is claimed by another."""
+        lease = Lease('%s.lock' % changes_path, owner, self.lease)
+        if lease.acquire(now) is False:
+            return None
+        if self.is_finished(changes_path):
+            # finished by another worker after listing
+            lease.release()
+            return None
+        return changes_path, lease
+
+    def _scan(self, finished, offset=0.0):
+        """
+        generate .changes files not finished yet with existence of their
+        lock files. each listing of directory is rotated by offset.
+
+        :param set finished: .changes file paths of finished jobs
+        :param float offset: ratio of rotation (0.0 - 1.0)
+        """
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            if dirpath == self.path and MARKER_DIR in dirnames:
+                dirnames.remove(MARKER_DIR)
+            dirnames[:] = rotate(sorted(dirnames), offset)
+            names = set(filenames)
+            for filename in rotate(sorted(filenames), offset):
+                changes_path = os.path.join(dirpath, filename)
+                if (filename.endswith('.changes') and
+                        changes_path not in finished):
+                    yield changes_path, '%s.lock' % filename in names
+
+    def finish(self, changes_path, owner, result, errors=()):
+        """
+        mark job of .changes as finished.
+
+        :param str changes_path: .changes file path
+        :param str owner: identifier of worker
+        :param result: return value or raised exception of debsign_process()
+        :param list errors: :class:`StageError
+
+            <pydebsign.process.StageError>` of timeouts and retries.
+        """
+        marker = self.marker(changes_path,
+                             'done' if result is True else 'failed')
+        try:
+            os.makedirs(os.path.dirname(marker))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(marker)):
+                raise
+        write_atomic(marker, json.dumps({'owner': owner,
+                                         'result': repr(result),
+                                         'errors': [error.as_dict()
+                                                    for error in errors],
+                                         'finished': time.time()}))
+
+    def requeue(self, changes_path):
+        """
+        requeue finished job of .changes.
+
+        :param str changes_path: .changes file path
+        """
+        for suffix in ('done', 'failed'):
+            if os.path.exists(self.marker(changes_path, suffix)):
+                os.remove(self.marker(changes_path, suffix))
+
+
+def rotate(items, offset):
+    """
+    rotate list by offset.
+
+    :rtype: list
+    :return: rotated list
+    :param list items: list to rotate
+    :param float offset: ratio of rotation (0.0 - 1.0)
+    """
+    index = int(len(items) * offset)
+    return items[index:] + items[:index]
+
+
+class Worker(object):
+    """The :class:`Worker <Worker>` object processing jobs of spool."""
+    def __init__(self, spool, **kwargs):
+        #: :class:`Spool <Spool>`
+        self.spool = spool
+        #: :data:`str`: identifier of worker
+        self.owner = worker_id()
+        #: :data:`dict`: keyword arguments of debsign_process()
+        self.kwargs = kwargs
+
+    def run(self, max_jobs=None):
+        """
+        process jobs until no claimable job.
+
+        :rtype: int
+        :return: number of processed jobs
+        :param int max_jobs: maximum number of jobs
+        """
+        count = 0
+        while max_jobs is None or count < max_jobs:
+            if self.run_once() is False:
+                break
+            count += 1
+        return count
+
+    def run_once(self):
+        """
+        claim and process a job.
+
+        :rtype: bool
+        :return: ``True`` is processed, ``False`` is no claimable job.
+        """
+        claimed = self.spool.claim(self.owner)
+        if claimed is None:
+            return False
+        changes_path, lease = claimed
+        leases = [lease]
+        errors = []
+        heartbeat = Heartbeat(leases, self.spool.lease / 3.0)
+        heartbeat.start()
+        try:
+            result = self.process(changes_path, leases, heartbeat, errors)
+        finally:
+            heartbeat.stop()
+        if heartbeat.lost is False and not isinstance(result, LeaseLost):
+            self.spool.finish(changes_path, self.owner, result, errors)
+        lease.release()
+        return True
+
+    def process(self, changes_path, leases, heartbeat, errors=None):
+        """
+        debsign process of .changes holding lease of .dsc.
+
+        :return: return value or raised exception of debsign_process(),
+                 :class:`LeaseLost` when a lease is lost.
+        :param str changes_path: .changes file path
+        :param list leases: leases renewed by heartbeat
+        :param heartbeat: :class:`Heartbeat` renewing leases
+        :param list errors: list extended with :class:`StageError
+
+            <pydebsign.process.StageError>` of timeouts and retries.
+        """
+        try:
+            dbsg = Debsign(changes_path)
+            dbsg.initialize()
+            dsc_lease = Lease('%s.lock' % dbsg.dsc_path, self.owner,
+                              self.spool.lease)
+            dsc_lease.wait()
+            leases.append(dsc_lease)
+            kwargs = dict(self.kwargs, errors=errors)
+            stage_hook = kwargs.get('stage_hook')
+            kwargs['stage_hook'] = lambda name: self.guarded_stage(
+                name, leases, heartbeat, stage_hook)
+            try:
+                return debsign_process(changes_path, **kwargs)
+            finally:
+                leases.remove(dsc_lease)
+                dsc_lease.release()
+        except Exception as exc:  # pylint: disable=broad-except
+            return exc
+
+    @contextlib.contextmanager
+    def guarded_stage(self, name, leases, heartbeat, stage_hook=None):
+        """
+        context manager of a stage checking leases before and after it,
+        so no file is written after a lease is lost.
+
+        :raises LeaseLost: a lease is lost.
+        :param str name: name of :data:`STAGES <pydebsign.debsign.STAGES>`
+        :param list leases: leases of the job
+        :param heartbeat: :class:`Heartbeat` renewing leases
+        :param function stage_hook: stage hook given to the worker
+        """
+        with (null_stage() if stage_hook is None else stage_hook(name)):
+            self.check_leases(leases, heartbeat)
+            yield
+        self.check_leases(leases, heartbeat)
+
+    @staticmethod
+    def check_leases(leases, heartbeat):
+        """
+        check leases of the job are still owned.
+
+        :raises LeaseLost: a lease is lost.
+        :param list leases: leases of the job
+        :param heartbeat: :class:`Heartbeat` renewing leases
+        """
+        for lease in list(leases):
+            if heartbeat.lost or lease.is_owned() is False:
+                heartbeat.lost = True
+                raise LeaseLost('lease %s is lost' % lease.path)
+
+
+def run_workers(spool_path, processes=2, lease=LEASE_DURATION, **kwargs):
+    """
+    run worker processes on the spool until no claimable job.
+
+    :rtype: list
+    :return: exit codes of worker processes
+
+    :param str spool_path: spool directory path
+    :param int processes: number of worker processes
+    :param float lease: duration of lease in seconds
+    :param kwargs: keyword arguments of
+                   :func:`debsign_process()
+                   <pydebsign.debsign.debsign_process>`
+    """
+    workers = [multiprocessing.Process(target=_run_worker,
+                                       args=(spool_path, lease, kwargs))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [worker.exitcode for worker in workers]
+
+
+def _run_worker(spool_path, lease, kwargs):
+    """target of worker process."""
+    Worker(Spool(spool_path, lease), **kwargs).run()
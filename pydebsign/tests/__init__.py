@@ -1 +1,25 @@
 """ pydebsign.tests """
+import os
+import shutil
+
+
+#: test data of shello package
+TEST_DATA = 'pydebsign/tests/test_data'
+
+#: .changes file name of test data
+CHANGES_NAME = 'shello_0.1-1_amd64.changes'
+
+
+def copy_test_data(count, build_dir='_build'):
+    """ copy test data to numbered directories of build_dir
+
+    :rtype: list
+    :return: .changes file paths of copies
+    :param int count: number of copies
+    :param str build_dir: directory removed by tearDown of tests
+    """
+    paths = []
+    for i in range(count):
+        shutil.copytree(TEST_DATA, os.path.join(build_dir, str(i)))
+        paths.append(os.path.join(build_dir, str(i), CHANGES_NAME))
+    return paths
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+pydebsign.tests.loadtest
+------------------------
+
+load test measuring sustained throughput and tail latency of
+batch signing with :class:`Scheduler <pydebsign.scheduler.Scheduler>`.
+
+fixtures are generated from ``pydebsign/tests/test_data`` with
+additional artifacts of given sizes, signed with the key of
+``misc/dummy_gpg``, and checked by a local stand-in of dput.
+this needs the source tree, so it is not a part of the installed
+package. each number of workers is run for a fixed duration in the
+top directory of the source tree, and the report is compared with a
+stored baseline::
+
+    $ python -m pydebsign.tests.loadtest --duration 60 --workers 1 2 4 \\
+        --sizes 0 1M 16M --output report.json --baseline baseline.json
+
+----
+"""
+import argparse
+import collections
+import json
+import math
+import os
+import os.path
+import re
+import shutil
+import stat
+import sys
+import tempfile
+import time
+from pydebsign import debsign, process
+from pydebsign.scheduler import Scheduler, PRIORITY_NORMAL
+from pydebsign.tests import CHANGES_NAME
+
+
+#: directory of test data
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'test_data')
+#: directory of dummy GPG key
+DUMMY_GPG = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))), 'misc', 'dummy_gpg')
+#: file name of generated artifact
+ARTIFACT_NAME = 'shello-data_0.1-1_all.deb'
+#: key id and passphrase of dummy GPG key
+KEYID = '5A046C53'
+PASSPHRASE = 'password'
+
+#: stand-in of dput, ``-H`` prints ``local`` host,
+#: ``-o`` checks the .changes exists after latency.
+DPUT_STAND_IN = '''#!%(python)s
+import os
+import sys
+import time
+if sys.argv[1:] == ['-H']:
+    print('local => localhost  (pydebsign load test)')
+    sys.exit(0)
+time.sleep(%(latency)f)
+sys.exit(0 if os.path.exists(sys.argv[-1]) else 1)
+'''
+
+
+def parse_size(size):
+    """
+    parse size with suffix of K, M or G.
+
+    :rtype: int
+    :return: size in bytes
+    :param str size: e.g. ``0``, ``512K``, ``16M``
+    """
+    match = re.match(r'\A(\d+)([KMG]?)\Z', size.upper())
+    if match is None:
+        raise argparse.ArgumentTypeError('invalid size: %s' % size)
+    return int(match.group(1)) * 1024 ** ' KMG'.index(match.group(2) or ' ')
+
+
+def percentile(values, rank):
+    """
+    percentile with nearest-rank method.
+
+    :rtype: float
+    :return: value at the rank, 0.0 for no values
+    :param list values: values
+    :param float rank: percentile rank (0 - 100)
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(math.ceil(rank / 100.0 * len(values))) - 1
+    return values[min(max(index, 0), len(values) - 1)]
+
+
+def add_artifact(changes_path, name, size):
+    """
+    add an artifact of random data to .changes and checksum fields.
+
+    :param str changes_path: .changes file path
+    :param str name: file name of artifact
+    :param int size: size of artifact in bytes
+    """
+    file_path = os.path.join(os.path.dirname(changes_path), name)
+    with open(file_path, 'wb') as fileobj:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, debsign.CHUNK_SIZE)
+            fileobj.write(os.urandom(chunk))
+            remaining -= chunk
+    with open(changes_path) as fileobj:
+        lines = fileobj.read().split('\n')
+    fields = [checksum_field for checksum_field in debsign.CHECKSUM_FIELDS
+              if '%s: ' % checksum_field[0] in lines]
+    digests = debsign.Debsign.retrieve_checksums(
+        file_path, [checksum_field[2] for checksum_field in fields])
+    for (field, _, _, columns), digest in zip(fields, digests):
+        if columns == 5:
+            line = ' %s %d misc optional %s' % (digest, size, name)
+        else:
+            line = ' %s %d %s' % (digest, size, name)
+        lines.insert(lines.index('%s: ' % field) + 1, line)
+    with open(changes_path, 'w') as fileobj:
+        fileobj.write('\n'.join(lines))
+
+
+def generate_fixtures(work_dir, count, sizes):
+    """
+    generate uploads from test data.
+
+    :rtype: list
+    :return: .changes file paths
+    :param str work_dir: working directory
+    :param int count: number of uploads
+    :param list sizes: sizes of artifact, used in turn, 0 is no artifact
+    """
+    paths = []
+    for index in range(count):
+        fixture_dir = os.path.join(work_dir, 'fixtures', str(index))
+        shutil.copytree(TEST_DATA, fixture_dir)
+        changes_path = os.path.join(fixture_dir, CHANGES_NAME)
+        size = sizes[index % len(sizes)]
+        if size:
+            add_artifact(changes_path, ARTIFACT_NAME, size)
+        paths.append(changes_path)
+    return paths
+
+
+def write_dput_stand_in(work_dir, latency):
+    """
+    write stand-in of dput.
+
+    :rtype: str
+    :return: path of stand-in
+    :param str work_dir: working directory
+    :param float latency: seconds of checking .changes
+    """
+    path = os.path.join(work_dir, 'dput')
+    with open(path, 'w') as fileobj:
+        fileobj.write(DPUT_STAND_IN % dict(python=sys.executable,
+                                           latency=latency))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+def run_load(paths, workers, duration, agent_slots=1, cpu_slots=None,
+             **kwargs):
+    """
+    submit uploads continuously to scheduler for the duration,
+    an upload is submitted again (re-signed) after finished.
+
+    :rtype: dict
+    :return: result of run
+    :param list paths: .changes file paths
+    :param int workers: number of workers of scheduler
+    :param float duration: seconds to submit uploads
+    :param int agent_slots: concurrency of gpg-agent-bound stages
+    :param int cpu_slots: concurrency of CPU-bound stages
+    :param kwargs: keyword arguments of debsign_process()
+    """
+    free = collections.deque(paths)
+    running = []
+    latencies = []
+    failures = 0
+    scheduler = Scheduler(workers=workers, cpu_slots=cpu_slots,
+                          agent_slots=agent_slots)
+    started = process.timer()
+    try:
+        while True:
+            while free and process.timer() < started + duration:
+                running.append(scheduler.submit(free.popleft(),
+                                                priority=PRIORITY_NORMAL,
+                                                resign=True, **kwargs))
+            if not running:
+                break
+            time.sleep(0.005)
+            for job in [job for job in running if job.wait(0)]:
+                running.remove(job)
+                free.append(job.changes_path)
+                latencies.append(job.finished - job.submitted)
+                if job.exception is not None or job.value is not True:
+                    failures += 1
+        elapsed = process.timer() - started
+        metrics = scheduler.metrics()
+    finally:
+        scheduler.shutdown()
+    return {'workers': workers,
+            'packages': len(latencies),
+            'failures': failures,
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed * 60 if elapsed else 0.0,
+            'mean': (sum(latencies) / len(latencies)) if latencies else 0.0,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'gates': metrics['gates']}
+
+
+def compare(report, baseline, tolerance=0.1):
+    """
+    compare report with baseline for the same numbers of workers.
+
+    :rtype: list
+    :return: messages of regressions
+    :param dict report: report of this run
+    :param dict baseline: stored report
+    :param float tolerance: allowed ratio of regression
+    """
+    regressions = []
+    base_runs = dict((run['workers'], run) for run in baseline['runs'])
+    for run in report['runs']:
+        base = base_runs.get(run['workers'])
+        if base is None:
+            continue
+        run['baseline'] = dict((key, base[key])
+                               for key in ('throughput', 'p50', 'p95',
+                                           'p99'))
+        if run['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(
+                'workers=%d: throughput %.1f < baseline %.1f pkg/min'
+                % (run['workers'], run['throughput'], base['throughput']))
+        for key in ('p95', 'p99'):
+            if run[key] > base[key] * (1 + tolerance):
+                regressions.append(
+                    'workers=%d: %s %.3fs > baseline %.3fs'
+                    % (run['workers'], key, run[key], base[key]))
+    return regressions
+
+
+def format_report(report):
+    """
+    format report as table.
+
+    :rtype: str
+    :return: table of runs
+    :param dict report: report
+    """
+    lines = ['%7s %8s %8s %10s %8s %8s %8s' % ('workers', 'packages',
+                                               'failures', 'pkg/min',
+                                               'p50', 'p95', 'p99')]
+    for run in report['runs']:
+        lines.append('%7d %8d %8d %10.1f %8.3f %8.3f %8.3f'
+                     % (run['workers'], run['packages'], run['failures'],
+                        run['throughput'], run['p50'], run['p95'],
+                        run['p99']))
+        if 'baseline' in run:
+            lines.append('%7s %8s %8s %10.1f %8.3f %8.3f %8.3f'
+                         % ('base', '', '', run['baseline']['throughput'],
+                            run['baseline']['p50'], run['baseline']['p95'],
+                            run['baseline']['p99']))
+    return '\n'.join(lines)
+
+
+def load_test(workers=(1,), duration=60.0, sizes=(0,), agent_slots=1,
+              cpu_slots=None, dput_latency=0.05, gnupghome=DUMMY_GPG,
+              verify_artifacts=True):
+    """
+    run load test for each number of workers.
+
+    :rtype: dict
+    :return: report with configuration and runs
+    :param tuple workers: numbers of workers
+    :param float duration: seconds of each run
+    :param tuple sizes: sizes of artifact of uploads in turn
+    :param int agent_slots: concurrency of gpg-agent-bound stages
+    :param int cpu_slots: concurrency of CPU-bound stages
+    :param float dput_latency: seconds of stand-in of dput
+    :param str gnupghome: directory of GPG key copied for load test
+    :param bool verify_artifacts: ``True`` is hashing all artifacts
+    """
+    work_dir = tempfile.mkdtemp(prefix='pydebsign-loadtest-')
+    try:
+        dput_command = write_dput_stand_in(work_dir, dput_latency)
+        gpg_dir = os.path.join(work_dir, 'gnupg')
+        # sockets of running gpg-agent are not copyable
+        shutil.copytree(gnupghome, gpg_dir,
+                        ignore=shutil.ignore_patterns('S.*'))
+        os.chmod(gpg_dir, 0o700)
+        paths = generate_fixtures(work_dir, max(workers) * 2, sizes)
+        runs = [run_load(paths[:count * 2], count, duration,
+                         agent_slots=agent_slots, cpu_slots=cpu_slots,
+                         passphrase=PASSPHRASE, keyid=KEYID,
+                         gnupghome=gpg_dir, lintian=False,
+                         verify_artifacts=verify_artifacts,
+                         dput_command=dput_command)
+                for count in workers]
+    finally:
+        shutil.rmtree(work_dir)
+    return {'config': {'workers': list(workers),
+                       'duration': duration,
+                       'sizes': list(sizes),
+                       'agent_slots': agent_slots,
+                       'cpu_slots': cpu_slots,
+                       'dput_latency': dput_latency,
+                       'verify_artifacts': verify_artifacts},
+            'runs': runs}
+
+
+def main(argv=None):
+    """
+    command line interface of load test.
+
+    :rtype: int
+    :return: 0 is passed, 1 is regression against baseline.
+    :param list argv: command line arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m pydebsign.tests.loadtest',
+        description='load test of batch signing of pydebsign')
+    parser.add_argument('--duration', type=float, default=60.0,
+                        help='seconds of each run (default: 60)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1],
+                        help='numbers of workers (default: 1)')
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[0],
+                        help='sizes of additional artifact in turn, '
+                        'e.g. 0 1M 16M (default: 0)')
+    parser.add_argument('--agent-slots', type=int, default=1,
+                        help='concurrency of sign and verify (default: 1)')
+    parser.add_argument('--cpu-slots', type=int, default=None,
+                        help='concurrency of hash and dput '
+                        '(default: number of CPUs)')
+    parser.add_argument('--dput-latency', type=float, default=0.05,
+                        help='seconds of stand-in of dput (default: 0.05)')
+    parser.add_argument('--gnupghome', default=DUMMY_GPG,
+                        help='GPG home directory (default: misc/dummy_gpg)')
+    parser.add_argument('--output', help='path to write JSON report')
+    parser.add_argument('--baseline', help='path of baseline JSON report')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed ratio of regression (default: 0.1)')
+    args = parser.parse_args(argv)
+
+    report = load_test(workers=args.workers, duration=args.duration,
+                       sizes=args.sizes, agent_slots=args.agent_slots,
+                       cpu_slots=args.cpu_slots,
+                       dput_latency=args.dput_latency,
+                       gnupghome=args.gnupghome)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as fileobj:
+            regressions = compare(report, json.load(fileobj),
+                                  args.tolerance)
+        report['regressions'] = regressions
+    print(format_report(report))
+    for regression in regressions:
+        print('REGRESSION: %s' % regression)
+    if args.output:
+        with open(args.output, 'w') as fileobj:
+            json.dump(report, fileobj, indent=2, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+""" pydebsing.tests.test_batch """
+
+import unittest
+import contextlib
+import shutil
+import os
+import threading
+import time
+from pydebsign import batch
+from pydebsign.tests import copy_test_data
+
+
+class BatchTests(unittest.TestCase):
+    """ Unit test of pydebsign.batch """
+
+    def setUp(self):
+        self.paths = copy_test_data(3)
+        self.gnupghome = os.path.abspath('misc/dummy_gpg')
+        self.keyid = '5A046C53'
+        self.passphrase = 'password'
+
+    def tearDown(self):
+        shutil.rmtree('_build')
+
+    def test_debsign_batch(self):
+        """ signing some .changes concurrently """
+        results = batch.debsign_batch(self.paths,
+                                      processes=2,
+                                      passphrase=self.passphrase,
+                                      keyid=self.keyid,
+                                      gnupghome=self.gnupghome,
+                                      lintian=False)
+        self.assertEqual(self.paths, [path for path, _, _ in results])
+        self.assertEqual([True] * 3, [result for _, result, _ in results])
+
+    def test_debsign_batch_resign(self):
+        """ re-signing some signed .changes concurrently """
+        for path in self.paths:
+            shutil.copyfile('%s.signed' % path, path)
+            dsc_path = os.path.join(os.path.dirname(path),
+                                    'shello_0.1-1.dsc')
+            shutil.copyfile('%s.signed' % dsc_path, dsc_path)
+        results = batch.debsign_batch(self.paths,
+                                      passphrase=self.passphrase,
+                                      keyid=self.keyid,
+                                      gnupghome=self.gnupghome,
+                                      lintian=False,
+                                      resign=True)
+        self.assertEqual([True] * 3, [result for _, result, _ in results])
+
+    def test_debsign_batch_failure(self):
+        """ failure of a .changes does not stop the others """
+        results = batch.debsign_batch(self.paths + ['_build/dummy.changes'],
+                                      passphrase=self.passphrase,
+                                      keyid=self.keyid,
+                                      gnupghome=self.gnupghome,
+                                      lintian=False)
+        self.assertEqual([True] * 3, [result for _, result, _ in results[:3]])
+        self.assertTrue(isinstance(results[3][1], Exception))
+
+    def test_debsign_batch_verify_artifacts(self):
+        """ shared files of uploads are hashed once in a batch """
+        for path in self.paths[1:]:
+            name = os.path.join(os.path.dirname(path),
+                                'shello_0.1.orig.tar.gz')
+            os.remove(name)
+            os.link('_build/0/shello_0.1.orig.tar.gz', name)
+        cache = batch.HashCache()
+        stages = []
+
+        @contextlib.contextmanager
+        def stage_hook(name):
+            """ record stages """
+            stages.append(name)
+            yield
+
+        results = batch.debsign_batch(self.paths,
+                                      hash_cache=cache,
+                                      passphrase=self.passphrase,
+                                      keyid=self.keyid,
+                                      gnupghome=self.gnupghome,
+                                      lintian=False,
+                                      verify_artifacts=True,
+                                      stage_hook=stage_hook)
+        self.assertEqual([True] * 3, [result for _, result, _ in results])
+        self.assertTrue(cache.hits >= 2)
+        # .dsc before signing .changes, and 4 files of .changes,
+        # except files hashed by another upload
+        self.assertEqual(3 * 5 - cache.hits, stages.count('hash'))
+
+    def test_hash_cache(self):
+        """ a file is hashed once, concurrent requests wait for it """
+        calls = []
+
+        def checksums(file_path):
+            """ dummy hash function """
+            calls.append(file_path)
+            time.sleep(0.1)
+            return ('checksum',)
+
+        path = '_build/0/shello_0.1.orig.tar.gz'
+        os.link(path, '_build/link.tar.gz')
+        cache = batch.HashCache()
+        results = []
+        stages = []
+
+        @contextlib.contextmanager
+        def stage():
+            """ record stages """
+            stages.append('hash')
+            yield
+
+        def request(file_path):
+            """ request checksums of file """
+            results.append(cache.get(file_path, checksums, stage=stage()))
+
+        threads = [threading.Thread(target=request, args=(name,))
+                   for name in (path, '_build/link.tar.gz', path)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([('checksum',)] * 3, results)
+        self.assertEqual(1, len(calls))
+        self.assertEqual((1, 2), (cache.misses, cache.hits))
+        # waiting threads do not enter the stage
+        self.assertEqual(['hash'], stages)
+
+        # modified file is hashed again
+        os.utime(path, (0, 0))
+        cache.get(path, checksums)
+        self.assertEqual(2, len(calls))
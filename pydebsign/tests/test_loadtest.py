@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+""" pydebsing.tests.test_loadtest """
+
+import unittest
+import shutil
+import os
+import subprocess
+from pydebsign import debsign
+from pydebsign.tests import loadtest
+
+
+class LoadtestTests(unittest.TestCase):
+    """ Unit test of pydebsign.tests.loadtest """
+
+    def setUp(self):
+        os.mkdir('_build')
+
+    def tearDown(self):
+        shutil.rmtree('_build')
+
+    def test_parse_size(self):
+        """ unit test of parse_size() """
+        self.assertEqual(0, loadtest.parse_size('0'))
+        self.assertEqual(512 * 1024, loadtest.parse_size('512k'))
+        self.assertEqual(16 * 1024 ** 2, loadtest.parse_size('16M'))
+
+    def test_percentile(self):
+        """ unit test of percentile() """
+        values = list(range(100, 0, -1))
+        self.assertEqual(50, loadtest.percentile(values, 50))
+        self.assertEqual(95, loadtest.percentile(values, 95))
+        self.assertEqual(100, loadtest.percentile(values, 100))
+        self.assertEqual(0.0, loadtest.percentile([], 99))
+
+    def test_generate_fixtures(self):
+        """ generated artifacts are listed in checksum fields """
+        paths = loadtest.generate_fixtures('_build', 2, [0, 4096])
+        for path, size in zip(paths, (0, 4096)):
+            dbsg = debsign.Debsign(path)
+            file_list = dbsg.parse_changes()
+            names = [_file.get('name') for _file in file_list[0]]
+            self.assertEqual(size > 0, loadtest.ARTIFACT_NAME in names)
+        artifact = os.path.join(os.path.dirname(paths[1]),
+                                loadtest.ARTIFACT_NAME)
+        self.assertEqual(4096, os.path.getsize(artifact))
+        expected = tuple([_file.get(checksum_field[1]) for _file in files
+                          if _file.get('name') == loadtest.ARTIFACT_NAME][0]
+                         for checksum_field, files
+                         in zip(dbsg.checksum_fields, file_list))
+        self.assertEqual(expected, dbsg.checksums(artifact))
+
+    def test_dput_stand_in(self):
+        """ stand-in of dput defines local host """
+        path = loadtest.write_dput_stand_in('_build', 0)
+        self.assertTrue(b'local => ' in subprocess.check_output([path, '-H']))
+        self.assertEqual(0, subprocess.call([path, '-o', 'local', path]))
+        self.assertTrue(debsign.check_dput_host('local', dput_command=path))
+        self.assertFalse(debsign.check_dput_host('dummy', dput_command=path))
+
+    def test_compare(self):
+        """ regressions against baseline """
+        baseline = {'runs': [{'workers': 1, 'throughput': 100.0,
+                              'p50': 1.0, 'p95': 2.0, 'p99': 3.0}]}
+        report = {'runs': [{'workers': 1, 'throughput': 95.0,
+                            'p50': 1.5, 'p95': 2.1, 'p99': 4.0},
+                           {'workers': 2, 'throughput': 10.0,
+                            'p50': 9.0, 'p95': 9.0, 'p99': 9.0}]}
+        regressions = loadtest.compare(report, baseline, tolerance=0.1)
+        self.assertEqual(1, len(regressions))
+        self.assertTrue('p99' in regressions[0])
+        self.assertEqual(100.0, report['runs'][0]['baseline']['throughput'])
+        self.assertFalse('baseline' in report['runs'][1])
+
+    def test_load_test(self):
+        """ short load test with dummy GPG key and stand-in of dput """
+        report = loadtest.load_test(workers=(1, 2), duration=1,
+                                    sizes=(0, 4096), dput_latency=0)
+        self.assertEqual([1, 2], [run['workers'] for run in report['runs']])
+        for run in report['runs']:
+            self.assertTrue(run['packages'] > 0)
+            self.assertEqual(0, run['failures'])
+            self.assertTrue(run['p50'] <= run['p95'] <= run['p99'])
+        self.assertTrue('pkg/min' in loadtest.format_report(report))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+""" pydebsing.tests.test_pipeline """
+
+import unittest
+import shutil
+import os
+import threading
+import time
+from pydebsign import pipeline
+from pydebsign.tests import copy_test_data
+
+
+class PipelineTests(unittest.TestCase):
+    """ Unit test of pydebsign.pipeline """
+
+    def setUp(self):
+        self.paths = copy_test_data(4)
+
+    def tearDown(self):
+        shutil.rmtree('_build')
+
+    def test_pipeline(self):
+        """ signing .changes on pipeline """
+        pipe = pipeline.Pipeline(workers={'hash': 2},
+                                 passphrase='password',
+                                 keyid='5A046C53',
+                                 gnupghome=os.path.abspath('misc/dummy_gpg'),
+                                 lintian=False)
+        self.assertEqual([(path, True, []) for path in self.paths],
+                         pipe.run(self.paths))
+        utilization = pipe.utilization()
+        self.assertEqual(sorted(name for name, _ in pipeline.STAGES),
+                         sorted(utilization))
+        for stage in utilization.values():
+            self.assertEqual(4, stage['items'])
+            self.assertTrue(0 <= stage['utilization'] <= 1)
+
+    def test_overlap_and_backpressure(self):
+        """ stages overlap across items, and queues bound items in flight """
+        lock = threading.Lock()
+        state = {'in_flight': 0, 'max_in_flight': 0, 'overlap': False}
+        active = set()
+
+        def enter(item, _):
+            """ first stage """
+            with lock:
+                state['in_flight'] += 1
+                state['max_in_flight'] = max(state['max_in_flight'],
+                                             state['in_flight'])
+            work('enter', item)
+
+        def work(name, item):
+            """ busy stage """
+            with lock:
+                active.add(name)
+                if len(active) > 1:
+                    state['overlap'] = True
+            time.sleep(0.02)
+            with lock:
+                active.discard(name)
+            if item.index == 2 and name == 'fail':
+                raise ValueError('failure')
+
+        def leave(item, _):
+            """ last stage """
+            work('fail', item)
+            with lock:
+                state['in_flight'] -= 1
+            item.finish(True)
+
+        pipe = pipeline.Pipeline(
+            queue_size=1,
+            stages=(('enter', enter),
+                    ('middle', lambda item, _: work('middle', item)),
+                    ('leave', leave)))
+        paths = ['%d.changes' % i for i in range(20)]
+        results = pipe.run(paths)
+        self.assertEqual(paths, [path for path, _, _ in results])
+        self.assertTrue(isinstance(results[2][1], ValueError))
+        self.assertEqual([True] * 19,
+                         [result for path, result, _ in results
+                          if path != paths[2]])
+        self.assertTrue(state['overlap'])
+        # items in stages and in queues of size 1
+        self.assertTrue(state['max_in_flight'] <= 6)
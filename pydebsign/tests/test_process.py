@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+""" pydebsing.tests.test_process """
+
+import unittest
+import os
+import subprocess
+import time
+import types
+import warnings
+from pydebsign import process
+
+
+class ProcessTests(unittest.TestCase):
+    """ Unit test of pydebsign.process """
+
+    def setUp(self):
+        self.gnupghome = os.path.abspath('misc/dummy_gpg')
+
+    def test_call_command_timeout(self):
+        """ process group of command is killed after timeout """
+        self.assertEqual((0, b'ok\n'),
+                         process.call_command('dput', ['echo', 'ok'],
+                                              timeout=10,
+                                              stdout=subprocess.PIPE))
+        started = time.time()
+        with self.assertRaises(process.StageTimeout) as context:
+            process.call_command('dput',
+                                 ['sh', '-c', 'sleep 10 & sleep 10'],
+                                 timeout=0.2,
+                                 stdout=subprocess.PIPE)
+        self.assertTrue(time.time() - started < 5)
+        self.assertEqual('dput', context.exception.stage)
+        self.assertEqual('timeout', context.exception.kind)
+
+    def test_gpg_retries(self):
+        """ gpg operation is retried with backoff for transient failures
+        of gpg-agent, and each retry is recorded.
+        """
+        class Result(object):  # pylint: disable=too-few-public-methods
+            """ dummy result of gpg """
+            stderr = 'gpg: problem with the agent: Timeout\n'
+
+        attempts = []
+
+        def operation():
+            """ dummy gpg operation failing at first """
+            attempts.append(True)
+            if len(attempts) < 2:
+                return Result()
+            return True
+
+        runner = process.StageRunner(retries=2, backoff=0.01)
+        self.assertTrue(runner.run_gpg('sign', operation))
+        self.assertEqual(2, len(attempts))
+        self.assertEqual(['transient'],
+                         [error.kind for error in runner.errors])
+        self.assertEqual('sign', runner.errors[0].stage)
+
+        # transient failures in all attempts are raised
+        runner = process.StageRunner(retries=1, backoff=0.01)
+        with self.assertRaises(process.StageError) as context:
+            runner.run_gpg('sign', Result)
+        self.assertEqual('transient', context.exception.kind)
+        self.assertEqual(2, context.exception.attempt)
+        self.assertEqual(['transient'] * 2,
+                         [error.kind for error in runner.errors])
+        self.assertEqual('sign', context.exception.as_dict()['stage'])
+
+    def test_gpg_timeout(self):
+        """ process group of gpg operation is killed after timeout """
+        runner = process.StageRunner(timeouts={'sign': 0.2}, retries=0)
+
+        def operation():
+            """ dummy gpg operation hanging with a child process """
+            child = subprocess.Popen(['sh', '-c', 'sleep 10 & sleep 10'],
+                                     **process.new_session())
+            runner.watch(child)
+            child.wait()
+
+        started = time.time()
+        self.assertRaises(process.StageTimeout,
+                          runner.run_gpg, 'sign', operation)
+        self.assertTrue(time.time() - started < 5)
+        self.assertEqual(['timeout'], [error.kind for error in runner.errors])
+
+    def test_watched_gpg(self):
+        """ gpg is started in a new process group and watched """
+        groups = []
+
+        def watch(gpg_process):
+            """ record gpg process is leader of process group """
+            groups.append(os.getpgid(gpg_process.pid) == gpg_process.pid)
+
+        gpg = process.watched_gpg(watch, gnupghome=self.gnupghome)
+        self.assertTrue(gpg.list_keys())
+        self.assertTrue(groups)
+        self.assertTrue(all(groups))
+
+    def test_unsupported_gnupg(self):
+        """ unsupported python-gnupg is used as is with a warning """
+        gnupg = types.ModuleType('gnupg')
+        gnupg.__version__ = '0.6.0'
+        gnupg.GPG = type('GPG', (object,), {})
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            # pylint: disable=protected-access
+            self.assertTrue(process._watched_gpg_class(gnupg) is gnupg.GPG)
+        self.assertEqual([RuntimeWarning],
+                         [warning.category for warning in caught])
@@ -5,11 +5,35 @@ import unittest
 import shutil
 import os
 import sys
+import json
+import hashlib
+import subprocess
+from pydebsign import debsign, files, process
+
+
+#: import time budget of pydebsign.debsign in seconds, the import
+#: measures about 0.04s with deferred imports and 0.15s with eager
+#: imports of gnupg, deb822 and subprocess.
+IMPORT_BUDGET = float(os.environ.get('PYDEBSIGN_IMPORT_BUDGET', '0.08'))
+
+#: benchmark of cold start in a new interpreter
+COLD_START = '''
+import json, sys, time
+timer = getattr(time, 'perf_counter', time.time)
+started = timer()
 from pydebsign import debsign
+imported = timer() - started
+debsign.Debsign('_build/shello_0.1-1_amd64.changes',
+                gnupghome='misc/dummy_gpg')
+print(json.dumps({'import': imported,
+                  'loaded': [name for name in ('gnupg', 'deb822')
+                             if name in sys.modules]}))
+'''
 
 
 class PydebsignTests(unittest.TestCase):
     """ Unit test of pydebsign """
+    # pylint: disable=too-many-public-methods
 
     def setUp(self):
         shutil.copytree('pydebsign/tests/test_data', '_build')
@@ -150,6 +174,8 @@ class PydebsignTests(unittest.TestCase):
         5. Verify checksums from .changes and retreived checksums
         6. Verify signature of .dsc and .changes
         7. Fail .changes file with `dput -o .changes` command.
+
+        dput host is checked before any file is modified.
         """
         self.assertRaises(KeyError,
                           debsign.debsign_process,
@@ -159,3 +185,399 @@ class PydebsignTests(unittest.TestCase):
                           gnupghome=self.gnupghome,
                           lintian=False,
                           dput_host='dummy')
+        for name in ('shello_0.1-1_amd64.changes', 'shello_0.1-1.dsc'):
+            with open(os.path.join('_build', name), 'rb') as fileobj:
+                with open(os.path.join('pydebsign/tests/test_data', name),
+                          'rb') as original:
+                    self.assertEqual(original.read(), fileobj.read())
+
+    def test_fast_rewrite_case(self):
+        """ signing .changes with patching checksum lines of .dsc directly
+        instead of deb822 round-trip.
+        """
+        self.assertTrue(
+            debsign.debsign_process(self.changes_path,
+                                    passphrase=self.passphrase,
+                                    keyid=self.keyid,
+                                    gnupghome=self.gnupghome,
+                                    lintian=False,
+                                    fast_rewrite=True))
+
+    def test_fast_rewrite_bytes(self):
+        """ fast rewrite changes only the checksum lines of .dsc,
+        other bytes of .changes are kept as is.
+        """
+        dbsg = debsign.Debsign(self.changes_path, gnupghome=self.gnupghome,
+                               fast_rewrite=True)
+        dbsg.initialize()
+        with open(self.changes_path, 'rb') as fileobj:
+            original = fileobj.read().split(b'\n')
+        checksums = ('0' * 32, '1' * 40, '2' * 64)
+        self.assertTrue(dbsg.rewrite_changes(1234, checksums))
+        with open(self.changes_path, 'rb') as fileobj:
+            rewritten = fileobj.read().split(b'\n')
+        self.assertEqual(len(original), len(rewritten))
+        changed = [(before, after)
+                   for before, after in zip(original, rewritten)
+                   if before != after]
+        self.assertEqual(3, len(changed))
+        for before, after in changed:
+            self.assertTrue(before.endswith(b'.dsc'))
+            self.assertEqual(before.split()[2:], after.split()[2:])
+            self.assertEqual(b'1234', after.split()[1])
+        self.assertEqual(sorted(digest.encode('ascii')
+                                for digest in checksums),
+                         sorted(after.split()[0] for _, after in changed))
+
+    def test_patch_changes(self):
+        """ unit test of patch_changes() """
+        with open(self.changes_path, 'rb') as fileobj:
+            data = fileobj.read()
+        checksums = ('0' * 32, '1' * 40, '2' * 64)
+        patched = debsign.patch_changes(data, 1234, checksums)
+        self.assertEqual(len(data) + 3, len(patched))
+        self.assertTrue(checksums[0].encode('ascii') +
+                        b' 1234 misc optional shello_0.1-1.dsc\n' in patched)
+        self.assertTrue(checksums[1].encode('ascii') +
+                        b' 1234 shello_0.1-1.dsc\n' in patched)
+        self.assertTrue(checksums[2].encode('ascii') +
+                        b' 1234 shello_0.1-1.dsc\n' in patched)
+        self.assertEqual(data.count(b'\n'), patched.count(b'\n'))
+
+        # unexpected layout is fall back to deb822
+        self.assertEqual(
+            None,
+            debsign.patch_changes(data.replace(b'Checksums-Sha1', b'Sha1'),
+                                  1234, checksums))
+
+    def test_resign_case(self):
+        """ re-signing already signed .changes and .dsc;
+        1. Strip signatures of .changes and .dsc.
+        2. Signing .dsc file with GPG key.
+        3. Rewrite checksums of .dsc at .changes.
+        4. Signing .changes file with GPG key.
+        5. Verify signed files.
+        """
+        dbsg = debsign.Debsign(self.changes_path,
+                               passphrase=self.passphrase,
+                               keyid=self.keyid,
+                               gnupghome=self.gnupghome)
+        dbsg.initialize()
+        shutil.copyfile('%s.signed' % self.changes_path, self.changes_path)
+        shutil.copyfile('%s.signed' % dbsg.dsc_path, dbsg.dsc_path)
+        self.assertTrue(debsign.debsign_process(self.changes_path,
+                                                passphrase=self.passphrase,
+                                                keyid=self.keyid,
+                                                gnupghome=self.gnupghome,
+                                                lintian=False,
+                                                resign=True))
+
+    def test_resign_tampered_case(self):
+        """ tampered signed files are not re-signed """
+        dbsg = debsign.Debsign(self.changes_path,
+                               gnupghome=self.gnupghome)
+        dbsg.initialize()
+        shutil.copyfile('%s.signed' % self.changes_path, self.changes_path)
+        with open('%s.signed' % dbsg.dsc_path, 'rb') as fileobj:
+            tampered = fileobj.read().replace(b'Version: 0.1-1',
+                                              b'Version: 0.1-2')
+        with open(dbsg.dsc_path, 'wb') as fileobj:
+            fileobj.write(tampered)
+        with open(self.changes_path, 'rb') as fileobj:
+            changes = fileobj.read()
+        self.assertRaises(ValueError,
+                          debsign.debsign_process,
+                          self.changes_path,
+                          passphrase=self.passphrase,
+                          keyid=self.keyid,
+                          gnupghome=self.gnupghome,
+                          lintian=False,
+                          resign=True)
+        with open(dbsg.dsc_path, 'rb') as fileobj:
+            self.assertEqual(tampered, fileobj.read())
+        with open(self.changes_path, 'rb') as fileobj:
+            self.assertEqual(changes, fileobj.read())
+
+    def test_resign_old_key_case(self):
+        """ signatures of keys missing in gnupghome are verified
+        with resign_gnupghome before stripping them """
+        os.mkdir('_build/gnupg', 0o700)
+        dsc_path = '_build/shello_0.1-1.dsc'
+        shutil.copyfile('%s.signed' % dsc_path, dsc_path)
+        dbsg = debsign.Debsign(self.changes_path, gnupghome='_build/gnupg')
+        dbsg.initialize()
+        self.assertRaises(ValueError, dbsg.strip_signature, dsc_path)
+        self.assertTrue(dbsg.is_signed(dsc_path))
+        dbsg = debsign.Debsign(self.changes_path, gnupghome='_build/gnupg',
+                               resign_gnupghome=self.gnupghome)
+        dbsg.initialize()
+        self.assertTrue(dbsg.strip_signature(dsc_path))
+        self.assertFalse(dbsg.is_signed(dsc_path))
+
+    def test_is_strippable(self):
+        """ good signatures of expired keys are strippable """
+        class Result(object):  # pylint: disable=too-few-public-methods
+            """ result of verification """
+            def __init__(self, valid, key_status=None, sig_timestamp=None):
+                self.valid = valid
+                self.key_status = key_status
+                self.sig_timestamp = sig_timestamp
+
+        self.assertTrue(debsign.is_strippable(Result(True)))
+        self.assertTrue(debsign.is_strippable(
+            Result(False, 'signing key has expired', '1445000000')))
+        self.assertFalse(debsign.is_strippable(
+            Result(False, 'signing key has expired')))
+        self.assertFalse(debsign.is_strippable(
+            Result(False, 'signing key was revoked', '1445000000')))
+        self.assertFalse(debsign.is_strippable(Result(False)))
+
+    def test_strip_signature(self):
+        """ unit test of Debsign.strip_signature() """
+        dsc_path = '_build/shello_0.1-1.dsc'
+        with open(dsc_path, 'rb') as fileobj:
+            unsigned = fileobj.read()
+        shutil.copyfile('%s.signed' % dsc_path, dsc_path)
+        dbsg = debsign.Debsign(self.changes_path,
+                               gnupghome=self.gnupghome)
+        self.assertTrue(dbsg.strip_signature(dsc_path))
+        with open(dsc_path, 'rb') as fileobj:
+            self.assertEqual(unsigned, fileobj.read())
+        self.assertFalse(dbsg.strip_signature(dsc_path))
+        with open(dsc_path, 'rb') as fileobj:
+            self.assertEqual(unsigned, fileobj.read())
+
+    def test_verify_report(self):
+        """ verification checks return a report of all checks """
+        self.assertTrue(
+            debsign.debsign_process(self.changes_path,
+                                    passphrase=self.passphrase,
+                                    keyid=self.keyid,
+                                    gnupghome=self.gnupghome,
+                                    lintian=False))
+        dbsg = debsign.Debsign(self.changes_path,
+                               gnupghome=self.gnupghome,
+                               lintian=False)
+        dbsg.initialize()
+        shutil.copyfile('%s.invalid' % dbsg.dsc_path, dbsg.dsc_path)
+        report = dbsg.verify(dbsg.retrieve_filesize(dbsg.dsc_path),
+                             dbsg.retrieve_checksums(dbsg.dsc_path),
+                             dbsg.parse_changes(),
+                             checks=('filesize', 'checksums',
+                                     'dsc_signature', 'changes_signature'))
+        self.assertFalse(report.passed)
+        self.assertEqual(['filesize', 'checksums',
+                          'dsc_signature', 'changes_signature'],
+                         [result.name for result in report])
+        failures = dict((result.name, result.message)
+                        for result in report.failures)
+        self.assertEqual('invalid checksums of .dsc', failures['checksums'])
+        self.assertFalse('changes_signature' in failures)
+        self.assertTrue(all(result.duration >= 0 for result in report))
+
+    def test_stage_errors(self):
+        """ timeouts and retries of gpg are reported by debsign_process """
+        errors = []
+        self.assertRaises(process.StageTimeout,
+                          debsign.debsign_process,
+                          self.changes_path,
+                          passphrase=self.passphrase,
+                          keyid=self.keyid,
+                          gnupghome=self.gnupghome,
+                          lintian=False,
+                          timeouts={'sign': 0.001},
+                          retries=1,
+                          backoff=0.01,
+                          errors=errors)
+        self.assertEqual([('sign', 'timeout', 1), ('sign', 'timeout', 2)],
+                         [(error.stage, error.kind, error.attempt)
+                          for error in errors])
+
+    def test_verification_error(self):
+        """ exception raised in a check is reported and re-raised """
+        self.assertTrue(
+            debsign.debsign_process(self.changes_path,
+                                    passphrase=self.passphrase,
+                                    keyid=self.keyid,
+                                    gnupghome=self.gnupghome,
+                                    lintian=False))
+        dbsg = debsign.Debsign(self.changes_path,
+                               gnupghome=self.gnupghome,
+                               lintian=False)
+        dbsg.initialize()
+
+        def verify_with_dput():
+            """ dput is missing """
+            raise OSError(2, 'No such file or directory')
+        dbsg.verify_with_dput = verify_with_dput
+        args = (dbsg.retrieve_filesize(dbsg.dsc_path),
+                dbsg.retrieve_checksums(dbsg.dsc_path),
+                dbsg.parse_changes())
+        failures = dbsg.verify(*args).failures
+        self.assertEqual(['dput'], [result.name for result in failures])
+        self.assertTrue(isinstance(failures[0].exception, OSError))
+        self.assertRaises(OSError, dbsg.verification, *args)
+
+    def test_cold_start(self):
+        """ benchmark of import and construction of Debsign,
+        heavy modules and ``dput -H`` are deferred until first use.
+        """
+        output = subprocess.check_output([sys.executable, '-c', COLD_START])
+        result = json.loads(output.decode('utf-8'))
+        self.assertEqual([], result['loaded'])
+        self.assertTrue(result['import'] < IMPORT_BUDGET,
+                        'import of pydebsign.debsign took %.3fs'
+                        % result['import'])
+
+    def test_retrieve_checksums(self):
+        """ unit test of retrieve_checksums() with algorithms """
+        file_path = '_build/shello_0.1.orig.tar.gz'
+        with open(file_path, 'rb') as fileobj:
+            data = fileobj.read()
+        self.assertEqual((hashlib.md5(data).hexdigest(),
+                          hashlib.sha1(data).hexdigest(),
+                          hashlib.sha256(data).hexdigest()),
+                         debsign.Debsign.retrieve_checksums(file_path))
+        self.assertEqual((hashlib.sha512(data).hexdigest(),),
+                         debsign.Debsign.retrieve_checksums(file_path,
+                                                            ('sha512',)))
+
+    def test_sha512_case(self):
+        """ signing .changes with Checksums-Sha512 and without
+        Checksums-Sha1, digests are derived from .changes.
+        """
+        with open(self.changes_path) as fileobj:
+            lines = fileobj.read().split('\n')
+        sha1_index = lines.index('Checksums-Sha1: ')
+        names = [line.split()[-1] for line in lines[sha1_index + 1:]
+                 if line.startswith(' ')][:4]
+        del lines[sha1_index:sha1_index + 5]
+        lines.insert(-1, 'Checksums-Sha512: ')
+        for name in names:
+            file_path = os.path.join('_build', name)
+            lines.insert(-1, ' %s %d %s' % (
+                debsign.Debsign.retrieve_checksums(file_path,
+                                                   ('sha512',))[0],
+                os.path.getsize(file_path), name))
+        with open(self.changes_path, 'w') as fileobj:
+            fileobj.write('\n'.join(lines))
+
+        self.assertTrue(
+            debsign.debsign_process(self.changes_path,
+                                    passphrase=self.passphrase,
+                                    keyid=self.keyid,
+                                    gnupghome=self.gnupghome,
+                                    lintian=False,
+                                    fast_rewrite=True))
+        dbsg = debsign.Debsign(self.changes_path, gnupghome=self.gnupghome)
+        dbsg.initialize()
+        self.assertEqual(['Files', 'Checksums-Sha256', 'Checksums-Sha512'],
+                         [field[0] for field in dbsg.checksum_fields])
+
+    def test_digests_case(self):
+        """ digests decide checksum fields written to .changes, Files is
+        always written. unknown digests are rejected before any file is
+        modified.
+        """
+        self.assertRaises(ValueError,
+                          debsign.debsign_process,
+                          self.changes_path,
+                          passphrase=self.passphrase,
+                          keyid=self.keyid,
+                          gnupghome=self.gnupghome,
+                          lintian=False,
+                          digests=('sha256', 'sha3'))
+        names = ('shello_0.1-1_amd64.changes', 'shello_0.1-1.dsc')
+        for name in names:
+            with open(os.path.join('_build', name), 'rb') as fileobj:
+                with open(os.path.join('pydebsign/tests/test_data', name),
+                          'rb') as original:
+                    self.assertEqual(original.read(), fileobj.read())
+
+        for fast_rewrite in (False, True):
+            for name in names:
+                shutil.copyfile(os.path.join('pydebsign/tests/test_data',
+                                             name),
+                                os.path.join('_build', name))
+            self.assertTrue(
+                debsign.debsign_process(self.changes_path,
+                                        passphrase=self.passphrase,
+                                        keyid=self.keyid,
+                                        gnupghome=self.gnupghome,
+                                        lintian=False,
+                                        fast_rewrite=fast_rewrite,
+                                        verify_artifacts=True,
+                                        digests=('sha256', 'sha512')))
+            dbsg = debsign.Debsign(self.changes_path,
+                                   gnupghome=self.gnupghome)
+            dbsg.initialize()
+            file_list = dbsg.parse_changes()
+            self.assertEqual(['Files', 'Checksums-Sha256', 'Checksums-Sha512'],
+                             [field[0] for field in dbsg.checksum_fields])
+            self.assertEqual(4, len(file_list[2]))
+            for line in file_list[2]:
+                with open(os.path.join('_build', line['name']),
+                          'rb') as fileobj:
+                    data = fileobj.read()
+                self.assertEqual((hashlib.sha512(data).hexdigest(),
+                                  str(len(data))),
+                                 (line['sha512'], line['size']))
+
+    def test_fast_rewrite_digests(self):
+        """ fast rewrite cuts dropped checksum fields and inserts added
+        ones, other bytes of .changes are kept as is.
+        """
+        dbsg = debsign.Debsign(self.changes_path, gnupghome=self.gnupghome,
+                               fast_rewrite=True, digests=('sha512',))
+        dbsg.initialize()
+        with open(self.changes_path, 'rb') as fileobj:
+            original = fileobj.read()
+        checksums = ('0' * 32, '5' * 128)
+        self.assertTrue(dbsg.rewrite_changes(1234, checksums))
+        with open(self.changes_path, 'rb') as fileobj:
+            rewritten = fileobj.read()
+        added = rewritten[rewritten.index(b'Checksums-Sha512:\n'):
+                          rewritten.index(b'Files:')].split(b'\n')
+        self.assertIn(b' ' + b'5' * 128 + b' 1234 shello_0.1-1.dsc', added)
+        self.assertEqual(6, len(added))
+        self.assertEqual(
+            original[:original.index(b'Checksums-Sha1:')] +
+            original[original.index(b'Files:'):].replace(
+                b'da47c79805c77f2b4ce3be33332c3e55 789',
+                b'0' * 32 + b' 1234'),
+            rewritten.replace(b'\n'.join(added[:-1]) + b'\n', b''))
+
+    def test_output_dir_case(self):
+        """ signing .changes into output directory, source directory
+        is not modified and unchanged files are linked.
+        """
+        self.assertTrue(
+            debsign.debsign_process(self.changes_path,
+                                    passphrase=self.passphrase,
+                                    keyid=self.keyid,
+                                    gnupghome=self.gnupghome,
+                                    lintian=False,
+                                    output_dir='_build/output'))
+        for name in ('shello_0.1-1_amd64.changes', 'shello_0.1-1.dsc'):
+            with open(os.path.join('_build', name), 'rb') as fileobj:
+                with open(os.path.join('pydebsign/tests/test_data', name),
+                          'rb') as original:
+                    self.assertEqual(original.read(), fileobj.read())
+        self.assertTrue(os.path.samefile('_build/shello_0.1-1_all.deb',
+                                         '_build/output/'
+                                         'shello_0.1-1_all.deb'))
+        dbsg = debsign.Debsign('_build/output/shello_0.1-1_amd64.changes',
+                               gnupghome=self.gnupghome)
+        self.assertTrue(dbsg.is_signed(dbsg.changes_path))
+
+    def test_link_file(self):
+        """ unit test of link_file() """
+        src = '_build/shello_0.1-1_all.deb'
+        self.assertEqual('hardlink', files.link_file(src, '_build/a.deb'))
+        self.assertTrue(os.path.samefile(src, '_build/a.deb'))
+        self.assertEqual('hardlink', files.link_file(src, '_build/a.deb'))
+        self.assertEqual('copy',
+                         files.link_file(src, '_build/a.deb', copy=True))
+        self.assertFalse(os.path.samefile(src, '_build/a.deb'))
+        with open(src, 'rb') as fileobj, open('_build/a.deb', 'rb') as copy:
+            self.assertEqual(fileobj.read(), copy.read())
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+""" pydebsing.tests.test_scheduler """
+
+import unittest
+import contextlib
+import shutil
+import os
+import threading
+import time
+from pydebsign import process, scheduler
+from pydebsign.tests import copy_test_data
+
+
+class SchedulerTests(unittest.TestCase):
+    """ Unit test of pydebsign.scheduler """
+
+    def setUp(self):
+        self.paths = copy_test_data(3)
+        self.kwargs = dict(passphrase='password',
+                           keyid='5A046C53',
+                           gnupghome=os.path.abspath('misc/dummy_gpg'),
+                           lintian=False)
+
+    def tearDown(self):
+        shutil.rmtree('_build')
+
+    def test_priority_gate(self):
+        """ waiters of gate are served in order of priority """
+        gate = scheduler.PriorityGate(1)
+        served = []
+
+        def waiter(priority):
+            """ acquire a slot and record priority """
+            with gate.slot(priority):
+                served.append(priority)
+
+        gate.acquire()
+        threads = []
+        for priority in (scheduler.PRIORITY_BULK,
+                         scheduler.PRIORITY_NORMAL,
+                         scheduler.PRIORITY_URGENT):
+            threads.append(threading.Thread(target=waiter, args=(priority,)))
+            threads[-1].start()
+            while gate.metrics()['waiting'] < len(threads):
+                time.sleep(0.01)
+        gate.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([scheduler.PRIORITY_URGENT,
+                          scheduler.PRIORITY_NORMAL,
+                          scheduler.PRIORITY_BULK], served)
+        metrics = gate.metrics()
+        self.assertEqual(4, metrics['acquired'])
+        self.assertEqual(0, metrics['busy'])
+        self.assertTrue(metrics['wait_max'] > 0)
+
+    def test_scheduler(self):
+        """ signing .changes with bounded concurrency of stages """
+        with scheduler.Scheduler(workers=3, cpu_slots=2,
+                                 agent_slots=1) as sched:
+            jobs = [sched.submit(path, priority=scheduler.PRIORITY_BULK,
+                                 **self.kwargs)
+                    for path in self.paths[1:]]
+            jobs.append(sched.submit(self.paths[0],
+                                     priority=scheduler.PRIORITY_URGENT,
+                                     **self.kwargs))
+            self.assertEqual([True] * 3, [job.get() for job in jobs])
+            metrics = sched.metrics()
+        self.assertEqual(3, metrics['completed'])
+        self.assertEqual(0, metrics['queue_depth'])
+        self.assertEqual(1, metrics['gates']['agent']['slots'])
+        self.assertTrue(metrics['gates']['agent']['acquired'] > 0)
+
+    def test_job_errors(self):
+        """ timeouts of gpg are reported by job """
+        with scheduler.Scheduler(workers=1) as sched:
+            job = sched.submit(self.paths[0], timeouts={'sign': 0.001},
+                               retries=0, **self.kwargs)
+            self.assertRaises(process.StageTimeout, job.get)
+        self.assertEqual(['timeout'], [error.kind for error in job.errors])
+
+    def test_stage_hook(self):
+        """ stage hook of job is entered inside the gates """
+        stages = []
+
+        @contextlib.contextmanager
+        def stage_hook(stage):
+            """ record stage with busy slots of its gate """
+            gate = sched.gates[scheduler.STAGE_GATES[stage]]
+            stages.append((stage, gate.metrics()['busy']))
+            yield
+
+        with scheduler.Scheduler(workers=1) as sched:
+            job = sched.submit(self.paths[0], stage_hook=stage_hook,
+                               **self.kwargs)
+            self.assertTrue(job.get())
+        self.assertEqual(set(['hash', 'sign', 'verify', 'dput']),
+                         set(stage for stage, _ in stages))
+        self.assertEqual(set([1]), set(busy for _, busy in stages))
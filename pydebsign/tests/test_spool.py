@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+""" pydebsing.tests.test_spool """
+
+import unittest
+import contextlib
+import json
+import shutil
+import os
+import time
+from pydebsign import spool
+from pydebsign.tests import TEST_DATA, copy_test_data
+
+
+class SpoolTests(unittest.TestCase):
+    """ Unit test of pydebsign.spool """
+
+    def setUp(self):
+        self.paths = [os.path.abspath(path) for path in copy_test_data(3)]
+        self.lock_path = '%s.lock' % self.paths[0]
+
+    def tearDown(self):
+        shutil.rmtree('_build')
+
+    def test_lease(self):
+        """ lease is exclusive until released """
+        lease = spool.Lease(self.lock_path, 'worker1')
+        other = spool.Lease(self.lock_path, 'worker2')
+        self.assertTrue(lease.acquire())
+        self.assertFalse(other.acquire())
+        self.assertTrue(lease.renew())
+        self.assertFalse(other.renew())
+        other.release()
+        self.assertTrue(os.path.exists(self.lock_path))
+        lease.release()
+        self.assertTrue(other.acquire())
+
+    def test_expired_lease(self):
+        """ expired lease of dead worker is taken over """
+        lease = spool.Lease(self.lock_path, 'worker1', duration=60)
+        other = spool.Lease(self.lock_path, 'worker2', duration=60)
+        self.assertTrue(lease.acquire())
+        expired = time.time() - 120
+        os.utime(self.lock_path, (expired, expired))
+        self.assertTrue(other.acquire())
+        self.assertFalse(lease.renew())
+        self.assertTrue(other.is_owned())
+        # lease taken over is not removed by the previous owner
+        lease.release()
+        self.assertTrue(other.is_owned())
+
+    def test_clock_skew(self):
+        """ live lease is not broken by a clock ahead of file server """
+        lease = spool.Lease(self.lock_path, 'worker1', duration=60)
+        other = spool.Lease(self.lock_path, 'worker2', duration=60)
+        self.assertTrue(lease.acquire())
+
+        class SkewedTime(object):  # pylint: disable=too-few-public-methods
+            """ clock of a host 10 minutes ahead """
+            sleep = staticmethod(time.sleep)
+
+            @staticmethod
+            def time():
+                """ skewed time """
+                return time.time() + 600
+
+        spool.time = SkewedTime
+        try:
+            self.assertFalse(other.acquire())
+        finally:
+            spool.time = time
+        self.assertTrue(lease.is_owned())
+
+    def test_lease_lost(self):
+        """ job is aborted before writing when lease is lost """
+        queue = spool.Spool('_build')
+        lock_path = '%s.lock' % self.paths[0]
+
+        @contextlib.contextmanager
+        def take_over(_):
+            """ another worker takes over the lease """
+            with open(lock_path, 'w') as fileobj:
+                fileobj.write('worker2')
+            yield
+
+        worker = spool.Worker(queue,
+                              passphrase='password',
+                              keyid='5A046C53',
+                              gnupghome=os.path.abspath('misc/dummy_gpg'),
+                              lintian=False,
+                              stage_hook=take_over)
+        self.assertTrue(worker.run_once())
+        self.assertFalse(queue.is_finished(self.paths[0]))
+        with open(lock_path) as fileobj:
+            self.assertEqual('worker2', fileobj.read())
+        for name in ('shello_0.1-1_amd64.changes', 'shello_0.1-1.dsc'):
+            with open(os.path.join('_build/0', name), 'rb') as fileobj:
+                with open(os.path.join(TEST_DATA, name), 'rb') as original:
+                    self.assertEqual(original.read(), fileobj.read())
+
+    def test_claim(self):
+        """ claimed and finished jobs are not claimed again """
+        queue = spool.Spool('_build')
+        self.assertEqual(self.paths, queue.pending())
+        claimed = [queue.claim('worker%d' % index) for index in range(3)]
+        self.assertEqual(self.paths,
+                         sorted(changes_path for changes_path, _ in claimed))
+        self.assertEqual(None, queue.claim('worker4'))
+        changes_path, lease = claimed[0]
+        queue.finish(changes_path, 'worker0', True)
+        lease.release()
+        self.assertTrue(os.path.exists(os.path.join(
+            '_build', spool.MARKER_DIR,
+            os.path.relpath(changes_path, os.path.abspath('_build')) +
+            '.done')))
+        self.assertEqual(set([changes_path]), queue.finished())
+        self.assertEqual(sorted(set(self.paths) - set([changes_path])),
+                         queue.pending())
+        self.assertEqual(None, queue.claim('worker4'))
+        queue.requeue(changes_path)
+        self.assertEqual(changes_path, queue.claim('worker4')[0])
+
+    def test_claim_lazily(self):
+        """ held leases are skipped without probing time of file server
+        while unlocked jobs remain """
+        queue = spool.Spool('_build')
+        self.assertTrue(spool.Lease(self.lock_path, 'worker1').acquire())
+        probes = []
+
+        def server_time(_):
+            """ count probes of time of file server """
+            probes.append(None)
+            return time.time()
+
+        server_time_orig = spool.Lease.server_time
+        spool.Lease.server_time = server_time
+        try:
+            claimed = [queue.claim('worker2')[0], queue.claim('worker3')[0]]
+            self.assertEqual([], probes)
+            self.assertEqual(None, queue.claim('worker4'))
+            self.assertEqual(1, len(probes))
+        finally:
+            spool.Lease.server_time = server_time_orig
+        self.assertEqual(self.paths[1:], sorted(claimed))
+
+    def test_failed_marker(self):
+        """ timeouts of gpg are written to the marker of failed job """
+        queue = spool.Spool('_build')
+        worker = spool.Worker(queue,
+                              passphrase='password',
+                              keyid='5A046C53',
+                              gnupghome=os.path.abspath('misc/dummy_gpg'),
+                              lintian=False,
+                              timeouts={'sign': 0.001},
+                              retries=0)
+        self.assertTrue(worker.run_once())
+        changes_path = queue.finished().pop()
+        with open(queue.marker(changes_path, 'failed')) as fileobj:
+            marker = json.load(fileobj)
+        self.assertEqual([('sign', 'timeout')],
+                         [(error['stage'], error['kind'])
+                          for error in marker['errors']])
+
+    def test_run_workers(self):
+        """ some worker processes sign all .changes of spool """
+        self.assertEqual([0, 0],
+                         spool.run_workers(
+                             '_build', processes=2,
+                             passphrase='password',
+                             keyid='5A046C53',
+                             gnupghome=os.path.abspath('misc/dummy_gpg'),
+                             lintian=False))
+        for path in self.paths:
+            self.assertTrue(os.path.exists(
+                spool.Spool('_build').marker(path, 'done')))
+            self.assertFalse(os.path.exists('%s.lock' % path))
+        self.assertEqual([], spool.Spool('_build').pending())
@@ -48,8 +48,7 @@ requires = ['setuptools',
             'python_gnupg',
             'python_debian',
             'pexpect',
-            'chardet',
-            'pguard']
+            'chardet']
 
 with open('requirements.txt', 'w') as _file:
     _file.write('\n'.join(requires))